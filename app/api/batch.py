@@ -0,0 +1,22 @@
+from sqlalchemy import any_, bindparam, select
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+async def fetch_by_ids(db: AsyncSession, columns, key_column, ids):
+    """
+    Найти строки по списку UUID одним запросом (uuid = ANY(:ids)).
+
+    Возвращает (строки, отсутствующие id). Повторы в запросе схлопываются,
+    и строки, и отсутствующие id идут в порядке первого упоминания в запросе.
+    Длину списка ограничивает схема BatchGet (BATCH_GET_MAX_IDS).
+    """
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return [], []
+
+    result = await db.execute(
+        select(*columns).where(key_column == any_(bindparam('ids', ids, type_=ARRAY(UUID(as_uuid=True)))))
+    )
+    found = {row.uuid: row for row in result}
+    return [found[key] for key in ids if key in found], [key for key in ids if key not in found]
@@ -0,0 +1,44 @@
+import hashlib
+
+from fastapi import Request, Response
+from sqlalchemy import BigInteger, literal_column
+
+from app.api.serialization import ModelResponse
+
+
+def row_version(model, label: str = 'row_version'):
+    """
+    Версия строки - системная колонка xmin, меняется при каждом изменении строки
+    """
+    return literal_column(f'{model.__tablename__}.xmin', BigInteger).label(label)
+
+
+def make_etag(*parts) -> str:
+    """
+    Сильный ETag из версий строк и параметров ответа
+    """
+    digest = hashlib.blake2b('|'.join(map(str, parts)).encode(), digest_size=16).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    # для If-None-Match используется слабое сравнение (RFC 9110)
+    return etag in (tag.strip().removeprefix('W/') for tag in header.split(','))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={'ETag': etag})
+
+
+def conditional_response(request: Request, body, etag: str) -> Response:
+    """
+    Вернуть 304 без тела, если клиент уже имеет эту версию, иначе body с заголовком ETag
+    """
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return ModelResponse(body, headers={'ETag': etag})
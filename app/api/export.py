@@ -0,0 +1,65 @@
+import csv
+import io
+import json
+
+from fastapi.responses import StreamingResponse
+
+from app.db.base import open_read_session
+
+
+EXPORT_MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def _json_default(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return str(value)
+
+
+def _encode_ndjson(rows) -> str:
+    return ''.join(
+        json.dumps(dict(row._mapping), default=_json_default, separators=(',', ':')) + '\n'
+        for row in rows
+    )
+
+
+def _encode_csv(rows, header=None) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header is not None:
+        writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+async def _stream_rows(query, export_format: str, chunk_size: int, request):
+    # своя сессия: генератор живёт дольше обработчика и его зависимостей
+    async with open_read_session(request) as session:
+        result = await session.stream(query.execution_options(yield_per=chunk_size))
+        header = list(result.keys()) if export_format == 'csv' else None
+        async for partition in result.partitions():
+            if export_format == 'csv':
+                yield _encode_csv(partition, header)
+                header = None
+            else:
+                yield _encode_ndjson(partition)
+        if header is not None:
+            # пустая выборка - отдаём хотя бы заголовок
+            yield _encode_csv([], header)
+
+
+def export_response(query, export_format: str, filename: str, request=None, chunk_size: int = 1000):
+    """
+    Отдать результат запроса потоком в NDJSON или CSV.
+
+    Строки читаются серверным курсором пачками по chunk_size и сразу
+    пишутся в ответ, поэтому память не зависит от размера таблицы.
+    """
+    return StreamingResponse(
+        _stream_rows(query, export_format, chunk_size, request),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={'Content-Disposition': f'attachment; filename="{filename}.{export_format}"'},
+    )
@@ -0,0 +1,65 @@
+from typing import Optional
+
+from fastapi import HTTPException
+
+from app.api.serialization import build, build_from, build_unchecked
+
+
+def parse_fields(fields: Optional[str], schema) -> Optional[tuple]:
+    """
+    Разобрать ?fields=uuid,title. None - все поля схемы, неизвестные поля - 400.
+
+    Поля возвращаются в порядке объявления в схеме, чтобы форма ответа не зависела
+    от порядка в запросе.
+    """
+    if fields is None:
+        return None
+    requested = {name.strip() for name in fields.split(',') if name.strip()}
+    unknown = requested - schema.model_fields.keys()
+    if unknown or not requested:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown)) or '(empty)'}")
+    return tuple(name for name in schema.model_fields if name in requested)
+
+
+def field_columns(model, schema, names: Optional[tuple]) -> list:
+    """
+    Колонки для SELECT: только запрошенные поля и uuid (ключ пагинации и ETag)
+    """
+    names = names or tuple(schema.model_fields)
+    columns = [getattr(model, name) for name in names]
+    if 'uuid' not in names:
+        columns.append(model.uuid)
+    return columns
+
+
+def build_item(schema, row, names: Optional[tuple]):
+    """
+    Элемент ответа из строки результата: целиком по схеме или только запрошенные поля
+    """
+    if names is None:
+        return build_from(schema, row)
+    # значения пришли из типизированных колонок, проверять частичный объект нечем и незачем
+    return {name: getattr(row, name) for name in names}
+
+
+def build_page(list_schema, names: Optional[tuple], **fields):
+    """
+    Страница списка; с частичными элементами модель не собирается
+    """
+    if names is None:
+        return build(list_schema, **fields)
+    return build_unchecked(list_schema, **fields)
+
+
+def patch_values(patch) -> dict:
+    """
+    Значения PATCH: только переданные поля. Пустой PATCH - 400, null - 422,
+    потому что все колонки NOT NULL.
+    """
+    values = patch.model_dump(exclude_unset=True)
+    if not values:
+        raise HTTPException(status_code=400, detail="No fields to update")
+    nulls = sorted(name for name, value in values.items() if value is None)
+    if nulls:
+        raise HTTPException(status_code=422, detail=f"Fields cannot be null: {', '.join(nulls)}")
+    return values
@@ -0,0 +1,54 @@
+import base64
+import binascii
+import json
+from typing import Optional
+from uuid import UUID
+
+from fastapi import HTTPException
+
+
+def encode_cursor(last_key: UUID) -> str:
+    """
+    Упаковать ключ последней строки страницы в непрозрачный курсор
+    """
+    payload = json.dumps({"k": str(last_key)}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> UUID:
+    """
+    Распаковать курсор, полученный от клиента
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return UUID(payload["k"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def paginate(query, key_column, limit: int, offset: int = 0, cursor: Optional[str] = None):
+    """
+    Применить к запросу стабильную сортировку и пагинацию.
+
+    С курсором используется seek по ключу (WHERE key > :last), без него - старый OFFSET.
+    Запрашивается на одну строку больше, чтобы понять, есть ли следующая страница.
+    """
+    query = query.order_by(key_column)
+    if cursor is not None:
+        query = query.where(key_column > decode_cursor(cursor))
+    elif offset:
+        query = query.offset(offset)
+    return query.limit(limit + 1)
+
+
+def split_page(items, limit: int, key=lambda item: item.uuid):
+    """
+    Отрезать лишнюю строку и вычислить next_cursor
+    """
+    items = list(items)
+    if len(items) > limit:
+        items = items[:limit]
+        if items:
+            return items, encode_cursor(key(items[-1]))
+    return items, None
@@ -0,0 +1,32 @@
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import func, or_
+
+
+def _like_prefix(q: str) -> str:
+    # экранируем через '/': смысл обратной косой черты в литералах зависит от standard_conforming_strings
+    escaped = q.replace('/', '//').replace('%', '/%').replace('_', '/_')
+    return f'{escaped}%'
+
+
+def search_condition(column, q: str):
+    """
+    Условие ?q=: префикс (ILIKE 'q%') или триграммное сходство (column % q).
+
+    Оба оператора обслуживает GIN-индекс gin_trgm_ops по колонке.
+    """
+    return or_(column.ilike(_like_prefix(q), escape='/'), column.op('%')(q))
+
+
+def search_order(column, q: str) -> tuple:
+    """
+    Сортировка результатов поиска: сначала совпадения по префиксу, затем по убыванию сходства
+    """
+    return column.ilike(_like_prefix(q), escape='/').desc(), func.similarity(column, q).desc()
+
+
+def check_search_cursor(q: Optional[str], cursor: Optional[str]):
+    # результаты поиска упорядочены по релевантности, seek по uuid к ним неприменим
+    if q is not None and cursor is not None:
+        raise HTTPException(status_code=400, detail="cursor cannot be combined with q, use offset")
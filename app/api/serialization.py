@@ -0,0 +1,59 @@
+from fastapi import Response
+from pydantic import BaseModel
+import pydantic_core
+
+import app.config as config
+
+
+class ModelResponse(Response):
+    """
+    JSON-ответ, сериализуемый напрямую из pydantic-модели (pydantic-core, Rust).
+
+    Возвращая его из обработчика, мы обходим повторную проверку response_model
+    в FastAPI, model_dump в словарь и json.dumps. Готовые байты (например, из кэша)
+    отдаются как есть.
+    """
+
+    media_type = 'application/json'
+
+    def render(self, content) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return to_json(content)
+
+
+def to_json(content) -> bytes:
+    if isinstance(content, BaseModel):
+        return type(content).__pydantic_serializer__.to_json(content)
+    # TRUSTED_OUTPUT: словари с полями схемы, UUID и datetime кодирует pydantic-core
+    return pydantic_core.to_json(content)
+
+
+def build(model_cls, **fields):
+    """
+    Собрать тело ответа по схеме. Обычно это одна проверка модели, в режиме
+    TRUSTED_OUTPUT данные из БД не проверяются: поля схемы (с умолчаниями)
+    складываются в словарь в порядке объявления.
+    """
+    if config.TRUSTED_OUTPUT:
+        return build_unchecked(model_cls, **fields)
+    return model_cls(**fields)
+
+
+def build_unchecked(model_cls, **fields) -> dict:
+    """
+    Поля схемы (с умолчаниями) словарём в порядке объявления, без проверки
+    """
+    return {
+        name: fields[name] if name in fields else field.get_default(call_default_factory=True)
+        for name, field in model_cls.model_fields.items()
+    }
+
+
+def build_from(model_cls, obj):
+    """
+    Собрать тело ответа из ORM-объекта или строки результата по именам полей схемы
+    """
+    if config.TRUSTED_OUTPUT:
+        return {name: getattr(obj, name) for name in model_cls.model_fields}
+    return model_cls.model_validate(obj, from_attributes=True)
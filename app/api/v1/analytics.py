@@ -0,0 +1,147 @@
+from typing import Literal
+
+from fastapi import APIRouter, Depends, Query, Request
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import app.config as config
+from app.api.etag import make_etag, conditional_response
+from app.api.serialization import build, to_json
+from app.db.analytics import analytics_refreshed_at, customer_sales, vegetable_sales
+from app.db.base import get_read_db
+from app.db.cache import analytics_cache
+from app.schemas.schemas import CustomerSales, TopCustomers, VegetableSales, ListVegetableSales, RevenueShare, RevenueBreakdown
+
+router = APIRouter()
+
+
+async def _cached_response(request: Request, db: AsyncSession, key: tuple, load):
+    """
+    Ответ из analytics_cache или собранный load(refreshed_at) и положенный в кэш.
+
+    ETag зависит от времени обновления представлений, поэтому между
+    обновлениями клиенты получают 304. Все поля ответа, включая имена,
+    читаются только из представлений, иначе 304 отдавал бы устаревшие имена.
+    """
+    cached = analytics_cache.get(key)
+    if cached is not None:
+        return conditional_response(request, *cached)
+    generation = analytics_cache.generation
+
+    refreshed_at = await analytics_refreshed_at(db)
+    body = to_json(await load(refreshed_at))
+    etag = make_etag(*key, refreshed_at)
+    analytics_cache.set(key, (body, etag), generation)
+    return conditional_response(request, body, etag)
+
+
+@router.get('/top-customers', response_model=TopCustomers)
+async def get_top_customers(
+    request: Request,
+    by: Literal['quantity', 'spend'] = 'quantity',
+    limit: int = Query(10, ge=1, le=config.ANALYTICS_MAX_LIMIT),
+    db: AsyncSession = Depends(get_read_db)
+    ):
+    """
+    Покупатели с наибольшим количеством купленного или суммой покупок
+    """
+    async def load(refreshed_at):
+        sort = customer_sales.c.total_quantity if by == 'quantity' else customer_sales.c.total_spend
+        result = await db.execute(
+            select(
+                customer_sales.c.customer_id,
+                customer_sales.c.full_name,
+                customer_sales.c.total_quantity,
+                customer_sales.c.total_spend,
+                customer_sales.c.order_count,
+            )
+            .order_by(sort.desc(), customer_sales.c.customer_id)
+            .limit(limit)
+        )
+        return build(
+            TopCustomers,
+            items=[build(CustomerSales, **row._mapping) for row in result],
+            by=by,
+            refreshed_at=refreshed_at
+        )
+
+    return await _cached_response(request, db, ('top-customers', by, limit), load)
+
+
+@router.get('/vegetables', response_model=ListVegetableSales)
+async def get_vegetable_sales(
+    request: Request,
+    order_by: Literal['quantity', 'revenue'] = 'revenue',
+    limit: int = Query(100, ge=1, le=config.ANALYTICS_MAX_LIMIT),
+    db: AsyncSession = Depends(get_read_db)
+    ):
+    """
+    Продажи по овощам: количество, число заказов и покупателей, выручка
+    """
+    async def load(refreshed_at):
+        sort = vegetable_sales.c.total_quantity if order_by == 'quantity' else vegetable_sales.c.revenue
+        result = await db.execute(
+            select(
+                vegetable_sales.c.vegetable_id,
+                vegetable_sales.c.title,
+                vegetable_sales.c.total_quantity,
+                vegetable_sales.c.order_count,
+                vegetable_sales.c.customer_count,
+                vegetable_sales.c.revenue,
+            )
+            .order_by(sort.desc(), vegetable_sales.c.vegetable_id)
+            .limit(limit)
+        )
+        return build(
+            ListVegetableSales,
+            items=[build(VegetableSales, **row._mapping) for row in result],
+            refreshed_at=refreshed_at
+        )
+
+    return await _cached_response(request, db, ('vegetables', order_by, limit), load)
+
+
+@router.get('/revenue', response_model=RevenueBreakdown)
+async def get_revenue(
+    request: Request,
+    limit: int = Query(100, ge=1, le=config.ANALYTICS_MAX_LIMIT),
+    db: AsyncSession = Depends(get_read_db)
+    ):
+    """
+    Общая выручка и доли овощей в ней (price * quantity по текущей цене)
+    """
+    async def load(refreshed_at):
+        # итоги считаются оконными функциями по всем строкам до LIMIT
+        total_revenue = func.sum(vegetable_sales.c.revenue).over().label('total_revenue')
+        total_quantity = func.sum(vegetable_sales.c.total_quantity).over().label('total_quantity')
+        result = await db.execute(
+            select(
+                vegetable_sales.c.vegetable_id,
+                vegetable_sales.c.title,
+                vegetable_sales.c.revenue,
+                total_revenue,
+                total_quantity,
+            )
+            .order_by(vegetable_sales.c.revenue.desc(), vegetable_sales.c.vegetable_id)
+            .limit(limit)
+        )
+        rows = result.all()
+        revenue = int(rows[0].total_revenue) if rows else 0
+        return build(
+            RevenueBreakdown,
+            total_revenue=revenue,
+            total_quantity=int(rows[0].total_quantity) if rows else 0,
+            items=[
+                build(
+                    RevenueShare,
+                    vegetable_id=row.vegetable_id,
+                    title=row.title,
+                    revenue=row.revenue,
+                    share=row.revenue / revenue if revenue else 0.0
+                )
+                for row in rows
+            ],
+            refreshed_at=refreshed_at
+        )
+
+    return await _cached_response(request, db, ('revenue', limit), load)
@@ -1,77 +1,164 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Optional
+from typing import Literal, Optional
 from uuid import UUID
-from app.db.base import get_db
-from fastapi import APIRouter, Depends, HTTPException
-from app.schemas.schemas import FilterCustomer, Customer, CreateCustomer, UpdateCustomer, DeleteCustomer, ListCustomer
-from app.models.models import Customer as CustomerDB, Order as OrderDB, Vegetable as VegetableDB
-from sqlalchemy import select, func
+from datetime import datetime
+from app.db.base import get_db, get_read_db
+from app.api.pagination import paginate, split_page
+from app.api.export import export_response
+from app.db.counts import row_counts, table_count, query_count
+from app.api.etag import row_version, make_etag, etag_matches, not_modified, conditional_response
+from app.api.serialization import ModelResponse, build, build_from
+from app.api.fields import parse_fields, field_columns, build_item, build_page, patch_values
+from app.api.batch import fetch_by_ids
+from app.api.search import search_condition, search_order, check_search_cursor
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from app.schemas.schemas import FilterCustomer, Customer, CreateCustomer, UpdateCustomer, PatchCustomer, DeleteCustomer, ListCustomer, BatchCustomer, BatchGet
+from app.models.models import Customer as CustomerDB, Order as OrderDB, Vegetable as VegetableDB, CustomerOrderStats
+from app.db.errors import violated_foreign_key
+from app.db.partitions import created_range
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.exc import IntegrityError
 
 router = APIRouter()
 
+CUSTOMER_COLUMNS = (CustomerDB.uuid, CustomerDB.full_name, CustomerDB.date_created)
+
 @router.get('/', response_model=ListCustomer)
 async def get_customers(
+    request: Request,
     min_total_quantity: Optional[int] = None,
     vegetable_type_id: Optional[UUID] = None,
     limit: int = 10,
     offset: int = 0,
-    db: AsyncSession = Depends(get_db)
+    cursor: Optional[str] = None,
+    count: Literal['exact', 'estimated', 'none'] = 'exact',
+    fields: Optional[str] = Query(None, description="Вернуть только эти поля: uuid,full_name"),
+    q: Optional[str] = Query(None, min_length=1, max_length=100, description="Поиск по имени: префикс или похожее написание"),
+    created_from: Optional[datetime] = Query(None, description="Учитывать заказы не раньше этого момента (ISO 8601)"),
+    created_to: Optional[datetime] = Query(None, description="Учитывать заказы раньше этого момента (ISO 8601)"),
+    db: AsyncSession = Depends(get_read_db)
 ):
     """
     Получить отфильтрованный список покупателей
     """
-    query = select(CustomerDB).distinct()
-    
-    if min_total_quantity is not None or vegetable_type_id is not None:
-        orders_subquery = select(OrderDB.customer_id)
-        
+    names = parse_fields(fields, Customer)
+    check_search_cursor(q, cursor)
+    query = select(*field_columns(CustomerDB, Customer, names))
+    by_stats = min_total_quantity is not None or vegetable_type_id is not None
+    period = created_range(created_from, created_to)
+    filtered = by_stats or q is not None or bool(period)
+
+    if q is not None:
+        query = query.where(search_condition(CustomerDB.full_name, q))
+
+    if period:
+        # customer_order_stats хранит агрегаты за всё время, поэтому за период
+        # считаем по orders: условие на created_at отсекает лишние партиции
+        orders_subquery = select(OrderDB.customer_id).where(*period)
         if vegetable_type_id is not None:
-            orders_subquery = orders_subquery.where(
-                OrderDB.vegetable_id == vegetable_type_id
-            )
-        
+            orders_subquery = orders_subquery.where(OrderDB.vegetable_id == vegetable_type_id)
         if min_total_quantity is not None:
             orders_subquery = orders_subquery.group_by(OrderDB.customer_id).having(
                 func.sum(OrderDB.quantity) >= min_total_quantity
             )
-        
         query = query.where(CustomerDB.uuid.in_(orders_subquery))
+    elif by_stats:
+        # фильтр читает агрегаты из customer_order_stats, а не сканирует orders
+        stats_subquery = select(CustomerOrderStats.customer_id).where(
+            CustomerOrderStats.order_count > 0
+        )
+
+        if vegetable_type_id is not None:
+            stats_subquery = stats_subquery.where(
+                CustomerOrderStats.vegetable_id == vegetable_type_id
+            )
+            if min_total_quantity is not None:
+                stats_subquery = stats_subquery.where(
+                    CustomerOrderStats.total_quantity >= min_total_quantity
+                )
+        else:
+            stats_subquery = stats_subquery.group_by(CustomerOrderStats.customer_id).having(
+                func.sum(CustomerOrderStats.total_quantity) >= min_total_quantity
+            )
+
+        query = query.where(CustomerDB.uuid.in_(stats_subquery))
 
-    total_query = select(func.count()).select_from(query.subquery())
-    total = await db.scalar(total_query)
+    if filtered:
+        total = await query_count(db, query.with_only_columns(CustomerDB.uuid), count)
+    else:
+        total = await table_count(db, CustomerDB, count)
 
-    query = query.offset(offset).limit(limit)
+    if q is not None:
+        query = query.order_by(*search_order(CustomerDB.full_name, q))
+    query = paginate(query.add_columns(row_version(CustomerDB)), CustomerDB.uuid, limit, offset, cursor)
     result = await db.execute(query)
-    items = result.scalars().all()
+    rows, next_cursor = split_page(result.all(), limit)
+    if q is not None:
+        next_cursor = None
 
-    customer_list = [
-        Customer(
-            uuid=item.uuid,
-            full_name=item.full_name,
-            date_created=item.date_created
-        ) for item in items
-    ]
+    etag = make_etag(total, next_cursor, names, *(f'{row.uuid}:{row.row_version}' for row in rows))
+    if etag_matches(request, etag):
+        return not_modified(etag)
 
-    return ListCustomer(
+    customer_list = [build_item(Customer, row, names) for row in rows]
+
+    return conditional_response(request, build_page(
+        ListCustomer,
+        names,
         items=customer_list,
-        total=total or 0,
+        total=total,
         limit=limit,
-        offset=offset
-    )
+        offset=offset if cursor is None else 0,
+        next_cursor=next_cursor
+    ), etag)
+
+@router.get('/export')
+async def export_customers(
+    request: Request,
+    export_format: Literal['ndjson', 'csv'] = Query('ndjson', alias='format')
+    ):
+    """
+    Выгрузить всех покупателей потоком в NDJSON или CSV
+    """
+    return export_response(select(*CUSTOMER_COLUMNS), export_format, 'customers', request)
+
+@router.post('/batch-get',response_model=BatchCustomer)
+async def batch_get_customers(
+    batch: BatchGet,
+    fields: Optional[str] = Query(None, description="Вернуть только эти поля: uuid,full_name"),
+    db: AsyncSession = Depends(get_read_db)
+    ):
+    """
+    Получить несколько покупателей по списку UUID одним запросом
+    """
+    names = parse_fields(fields, Customer)
+    rows, missing = await fetch_by_ids(db, field_columns(CustomerDB, Customer, names), CustomerDB.uuid, batch.ids)
+    return ModelResponse(build_page(
+        BatchCustomer,
+        names,
+        items=[build_item(Customer, row, names) for row in rows],
+        missing=missing
+    ))
 
 @router.get('/{customer_id}',response_model=Customer)
 async def get_customer(
     customer_id: str,
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    fields: Optional[str] = Query(None, description="Вернуть только эти поля: uuid,full_name"),
+    db: AsyncSession = Depends(get_read_db)
     ):
     """
     Получить покупателя по UUID
     """
-    result = await db.execute(select(CustomerDB).where(CustomerDB.uuid == customer_id))
-    customer = result.scalar_one_or_none()
-    if customer is None:
+    names = parse_fields(fields, Customer)
+    result = await db.execute(
+        select(*field_columns(CustomerDB, Customer, names), row_version(CustomerDB)).where(CustomerDB.uuid == customer_id)
+    )
+    row = result.one_or_none()
+    if row is None:
         raise HTTPException(status_code=404, detail="Customer not found")
-    return customer
+
+    return conditional_response(request, build_item(Customer, row, names), make_etag(row.uuid, row.row_version, names))
 
 @router.post('/',response_model=Customer)
 async def create_customer(
@@ -86,7 +173,25 @@ async def create_customer(
     )
     db.add(new_customer)
     await db.commit() 
-    return new_customer
+    row_counts.adjust(CustomerDB.__tablename__, 1)
+    return ModelResponse(build_from(Customer, new_customer))
+
+async def _update_customer(db: AsyncSession, customer_id: str, values: dict):
+    """
+    Изменить покупателя одним UPDATE ... RETURNING
+    """
+    result = await db.execute(
+        update(CustomerDB.__table__)
+        .where(CustomerDB.uuid == customer_id)
+        .values(**values)
+        .returning(*CUSTOMER_COLUMNS)
+    )
+    row = result.one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    customer = build_from(Customer, row)
+    await db.commit()
+    return ModelResponse(customer)
 
 @router.put('/{customer_id}',response_model=Customer)
 async def update_customer(
@@ -97,13 +202,18 @@ async def update_customer(
     """
     Обновить информацию о покупателе
     """
-    result = await db.execute(select(CustomerDB).where(CustomerDB.uuid == customer_id))
-    customer_in_db = result.scalar_one_or_none()
-    if customer_in_db is None:
-        raise HTTPException(status_code=404, detail="Customer not found")
-    customer_in_db.full_name = customer.full_name
-    await db.commit()
-    return customer_in_db
+    return await _update_customer(db, customer_id, customer.model_dump())
+
+@router.patch('/{customer_id}',response_model=Customer)
+async def patch_customer(
+    customer_id: str,
+    customer: PatchCustomer,
+    db: AsyncSession = Depends(get_db)
+    ):
+    """
+    Изменить только переданные поля покупателя
+    """
+    return await _update_customer(db, customer_id, patch_values(customer))
 
 @router.delete('/{customer_id}',response_model=DeleteCustomer)
 async def delete_customer(
@@ -113,15 +223,19 @@ async def delete_customer(
     """
     Удалить покупателя по UUID
     """
-    result = await db.execute(select(CustomerDB).where(CustomerDB.uuid == customer_id))
-    customer_in_db = result.scalar_one_or_none()
-    if customer_in_db is None:
+    try:
+        result = await db.execute(
+            delete(CustomerDB.__table__).where(CustomerDB.uuid == customer_id).returning(*CUSTOMER_COLUMNS)
+        )
+    except IntegrityError as exc:
+        await db.rollback()
+        if violated_foreign_key(exc) is None:
+            raise
+        raise HTTPException(status_code=409, detail="Customer has orders")
+    row = result.one_or_none()
+    if row is None:
         raise HTTPException(status_code=404, detail="Customer not found")
-    customer_data = Customer(
-        uuid=customer_in_db.uuid,
-        full_name=customer_in_db.full_name,
-        date_created=customer_in_db.date_created
-    )
-    await db.delete(customer_in_db)
+    customer_data = build_from(Customer, row)
     await db.commit()
-    return DeleteCustomer(message='Customer deleted successfully', deleted_customer=customer_data)
+    row_counts.adjust(CustomerDB.__tablename__, -1)
+    return ModelResponse(build(DeleteCustomer, message='Customer deleted successfully', deleted_customer=customer_data))
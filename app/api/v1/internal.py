@@ -0,0 +1,57 @@
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import app.config as config
+from app.coalescing import request_flights
+from app.db.analytics import analytics_refreshed_at, refresh_analytics
+from app.db.base import engine, replicas, get_db
+from app.db.cache import vegetable_cache, analytics_cache
+from app.db.pool import pool_stats
+
+router = APIRouter()
+
+
+@router.get('/cache')
+async def get_cache_stats():
+    """
+    Счётчики попаданий и промахов кэшей процесса
+    """
+    return {
+        'vegetables': vegetable_cache.stats(),
+        'analytics': analytics_cache.stats(),
+    }
+
+
+@router.get('/coalescing')
+async def get_coalescing_stats():
+    """
+    Сколько GET-запросов выполнено, а сколько получили ответ другого запроса
+    """
+    return request_flights.stats()
+
+
+@router.get('/pool')
+async def get_pool_stats():
+    """
+    Состояние пула соединений и время ожидания соединения
+    """
+    stats = pool_stats(engine)
+    # пул и счётчики /internal/* относятся к одному воркеру из WEB_CONCURRENCY
+    stats['workers'] = config.WEB_CONCURRENCY
+    stats['replicas'] = [
+        {'url': replica.engine.url.render_as_string(hide_password=True), **pool_stats(replica.engine)}
+        for replica in replicas
+    ]
+    return stats
+
+
+@router.post('/analytics/refresh')
+async def refresh_analytics_views(db: AsyncSession = Depends(get_db)):
+    """
+    Обновить представления аналитики сейчас, не дожидаясь фоновой задачи
+    """
+    refreshed = await refresh_analytics(db)
+    return {
+        'refreshed': refreshed,
+        'refreshed_at': await analytics_refreshed_at(db),
+    }
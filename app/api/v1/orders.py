@@ -1,52 +1,245 @@
-from fastapi import APIRouter, Depends, HTTPException
-from app.schemas.schemas import ListOrder, CreateOrder, UpdateOrder, Order,DeleteOrder,FullOrder, Customer, Vegetable
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
+from app.schemas.schemas import ListOrder, ListFullOrder, CreateOrder, UpdateOrder, PatchOrder, Order,DeleteOrder,FullOrder, Customer, Vegetable, BulkOrderError, BulkOrderResult, BulkOrderUpdate, BulkOrderChange, BatchOrder, BatchGet
 from app.models.models import Order as OrderDB, Customer as CustomerDB, Vegetable as VegetableDB
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.db.base import get_db
-from sqlalchemy import select
+from app.db.base import get_db, get_read_db
+from app.api.pagination import paginate, split_page
+from app.api.export import export_response
+from app.db.counts import row_counts, table_count, query_count
+from app.api.etag import row_version, make_etag, etag_matches, not_modified, conditional_response
+from app.api.serialization import ModelResponse, build, build_from
+from app.api.fields import parse_fields, field_columns, build_item, build_page, patch_values
+from app.api.batch import fetch_by_ids
+from app.db.order_stats import apply_order_deltas, upsert_order_stats
+from app.db.bulk_orders import existing_references, insert_order_rows, count_orders_where, delete_orders_where, update_orders_where
+from app.db.errors import violated_foreign_key
+from app.db.partitions import created_range
+from app.db.uuid7 import uuid7
+from sqlalchemy import select, insert, update, delete, func, literal, union_all
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import contains_eager, noload
+from typing import Literal, Optional, Union
+from uuid import UUID
+from datetime import datetime
+from pydantic import ValidationError
+import json
+import app.config as config
 
 router = APIRouter()
 
-@router.get('/',response_model=ListOrder)
+ORDER_COLUMNS = (OrderDB.uuid, OrderDB.vegetable_id, OrderDB.customer_id, OrderDB.quantity, OrderDB.created_at)
+
+# связи, которые можно раскрыть через ?expand=: имя -> (связь, модель БД, схема)
+EXPAND_RELATIONS = {
+    'customer': (OrderDB.customer, CustomerDB, Customer),
+    'vegetable': (OrderDB.vegetable, VegetableDB, Vegetable),
+}
+
+
+def _parse_expand(expand: Optional[str]) -> tuple:
+    """
+    Разобрать ?expand=customer,vegetable, неизвестные связи - 400
+    """
+    if not expand:
+        return ()
+    names = {name.strip() for name in expand.split(',') if name.strip()}
+    unknown = names - EXPAND_RELATIONS.keys()
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown expand: {', '.join(sorted(unknown))}")
+    return tuple(sorted(names))
+
+
+def _check_fields_with_expand(fields: Optional[str], expand: tuple):
+    if fields is not None and expand:
+        raise HTTPException(status_code=400, detail="fields cannot be combined with expand")
+
+
+def _expanded_orders(expand: tuple):
+    """
+    Заказы вместе с раскрытыми связями одним запросом (JOIN + contains_eager),
+    число запросов не зависит от размера страницы
+    """
+    query = select(OrderDB, row_version(OrderDB))
+    for name, (relation, model, _) in EXPAND_RELATIONS.items():
+        if name in expand:
+            query = query.join(relation).add_columns(row_version(model, f'{name}_version')).options(contains_eager(relation))
+        else:
+            # не раскрытая связь остаётся None, а не догружается лениво
+            query = query.options(noload(relation))
+    return query
+
+
+def _expanded_version(row, expand: tuple) -> str:
+    return ':'.join(str(getattr(row, f'{name}_version')) for name in ('row',) + expand)
+
+
+def _full_order(order) -> FullOrder:
+    related = {
+        name: build_from(schema, getattr(order, name))
+        for name, (_, _, schema) in EXPAND_RELATIONS.items()
+        if getattr(order, name) is not None
+    }
+    return build(FullOrder, **{name: getattr(order, name) for name in Order.model_fields}, **related)
+
+
+def _raise_missing_reference(exc: IntegrityError):
+    """
+    Превратить нарушение внешнего ключа в 404 по отсутствующей сущности
+    """
+    constraint = violated_foreign_key(exc)
+    if constraint and 'customer_id' in constraint:
+        raise HTTPException(status_code=404, detail="Customer not found")
+    if constraint and 'vegetable_id' in constraint:
+        raise HTTPException(status_code=404, detail="Vegetable not found")
+    raise exc
+
+
+BULK_ORDER_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {
+                "schema": {"type": "array", "items": {"$ref": "#/components/schemas/CreateOrder"}}
+            },
+            "application/x-ndjson": {
+                "schema": {"$ref": "#/components/schemas/CreateOrder"}
+            },
+        },
+    }
+}
+
+
+def _validation_detail(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(map(str, error['loc'])) or 'body'}: {error['msg']}" for error in exc.errors()
+    )
+
+@router.get('/',response_model=Union[ListOrder, ListFullOrder])
 async def get_orders(
-    db: AsyncSession = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    count: Literal['exact', 'estimated', 'none'] = 'exact',
+    expand: Optional[str] = Query(None, description="Раскрыть связи: customer,vegetable"),
+    fields: Optional[str] = Query(None, description="Вернуть только эти поля: uuid,quantity"),
+    created_from: Optional[datetime] = Query(None, description="Созданные не раньше этого момента (ISO 8601)"),
+    created_to: Optional[datetime] = Query(None, description="Созданные раньше этого момента (ISO 8601)")
     ):
     """
     Получить список всех заказов
     """
-    result = await db.execute(select(OrderDB).offset(skip).limit(limit))
-    items = result.scalars().all()
-    total = len(items)
-    order_list = [
-        Order(
-            uuid=item.uuid,
-            vegetable_id=item.vegetable_id,
-            customer_id=item.customer_id,
-            quantity=item.quantity
-        ) for item in items
-    ]
-    return ListOrder(
+    expand = _parse_expand(expand)
+    _check_fields_with_expand(fields, expand)
+    # период отсекает лишние помесячные партиции
+    period = created_range(created_from, created_to)
+    if expand:
+        return await _get_full_orders(request, db, skip, limit, cursor, count, expand, period)
+    names = parse_fields(fields, Order)
+
+    query = select(*field_columns(OrderDB, Order, names)).where(*period)
+    result = await db.execute(
+        paginate(query.add_columns(row_version(OrderDB)), OrderDB.uuid, limit, skip, cursor)
+    )
+    items, next_cursor = split_page(result.all(), limit)
+    total = await _orders_total(db, period, count)
+
+    etag = make_etag(total, next_cursor, names, *(f'{item.uuid}:{item.row_version}' for item in items))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    order_list = [build_item(Order, item, names) for item in items]
+    return conditional_response(request, build_page(
+        ListOrder,
+        names,
         items=order_list,
         total=total,
         limit=limit,
-        offset=skip
-    )
+        offset=skip if cursor is None else 0,
+        next_cursor=next_cursor
+    ), etag)
+
+async def _orders_total(db: AsyncSession, period: list, count: str):
+    if period:
+        return await query_count(db, select(OrderDB.uuid).where(*period), count)
+    return await table_count(db, OrderDB, count)
+
+async def _get_full_orders(request: Request, db: AsyncSession, skip: int, limit: int, cursor, count: str, expand: tuple, period: list):
+    result = await db.execute(paginate(_expanded_orders(expand).where(*period), OrderDB.uuid, limit, skip, cursor))
+    rows, next_cursor = split_page(result.all(), limit, key=lambda row: row.Order.uuid)
+    total = await _orders_total(db, period, count)
+
+    etag = make_etag(total, next_cursor, *expand, *(f'{row.Order.uuid}:{_expanded_version(row, expand)}' for row in rows))
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    return conditional_response(request, build(
+        ListFullOrder,
+        items=[_full_order(row.Order) for row in rows],
+        total=total,
+        limit=limit,
+        offset=skip if cursor is None else 0,
+        next_cursor=next_cursor
+    ), etag)
 
-@router.get('/{order_id}',response_model=Order)
+@router.get('/export')
+async def export_orders(
+    request: Request,
+    export_format: Literal['ndjson', 'csv'] = Query('ndjson', alias='format')
+    ):
+    """
+    Выгрузить все заказы потоком в NDJSON или CSV
+    """
+    return export_response(select(*ORDER_COLUMNS), export_format, 'orders', request)
+
+@router.post('/batch-get',response_model=BatchOrder)
+async def batch_get_orders(
+    batch: BatchGet,
+    fields: Optional[str] = Query(None, description="Вернуть только эти поля: uuid,quantity"),
+    db: AsyncSession = Depends(get_read_db)
+    ):
+    """
+    Получить несколько заказов по списку UUID одним запросом
+    """
+    names = parse_fields(fields, Order)
+    rows, missing = await fetch_by_ids(db, field_columns(OrderDB, Order, names), OrderDB.uuid, batch.ids)
+    return ModelResponse(build_page(
+        BatchOrder,
+        names,
+        items=[build_item(Order, row, names) for row in rows],
+        missing=missing
+    ))
+
+@router.get('/{order_id}',response_model=Union[Order, FullOrder])
 async def get_order(
     order_id: str,
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
+    expand: Optional[str] = Query(None, description="Раскрыть связи: customer,vegetable"),
+    fields: Optional[str] = Query(None, description="Вернуть только эти поля: uuid,quantity")
     ):
     """
     Получить заказ по UUID
     """
-    result = await db.execute(select(OrderDB).where(OrderDB.uuid == order_id))
-    order = result.scalar_one_or_none()
-    if order is None:
+    expand = _parse_expand(expand)
+    _check_fields_with_expand(fields, expand)
+    if expand:
+        row = (await db.execute(_expanded_orders(expand).where(OrderDB.uuid == order_id))).one_or_none()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+        etag = make_etag(row.Order.uuid, *expand, _expanded_version(row, expand))
+        return conditional_response(request, _full_order(row.Order), etag)
+    names = parse_fields(fields, Order)
+
+    result = await db.execute(
+        select(*field_columns(OrderDB, Order, names), row_version(OrderDB)).where(OrderDB.uuid == order_id)
+    )
+    row = result.one_or_none()
+    if row is None:
         raise HTTPException(status_code=404, detail="Order not found")
-    return order
+
+    return conditional_response(request, build_item(Order, row, names), make_etag(row.uuid, row.row_version, names))
 
 
 """
@@ -80,25 +273,31 @@ async def create_order(
     Создать новоый заказ
     """
 
-    # проверка на существование в бд.  так же можно использовать для FullOrder 
-    customer = await db.execute(select(CustomerDB).where(CustomerDB.uuid == order.customer_id))
-    customer = customer.scalar_one_or_none()
-    if customer is None:
-        raise HTTPException(status_code=404, detail="Customer not found")
-    
-    vegetable = await db.execute(select(VegetableDB).where(VegetableDB.uuid == order.vegetable_id))
-    vegetable = vegetable.scalar_one_or_none()
-    if vegetable is None:
-        raise HTTPException(status_code=404, detail="Vegetable not found")
-    
-    new_order = OrderDB(
-        vegetable_id = order.vegetable_id,
-        customer_id = order.customer_id,
-        quantity = order.quantity
+    # одна вставка: заказ и агрегат customer_order_stats в одном CTE,
+    # существование покупателя и овоща проверяют внешние ключи
+    new_order = (
+        insert(OrderDB.__table__)
+        .values(
+            vegetable_id=order.vegetable_id,
+            customer_id=order.customer_id,
+            quantity=order.quantity
+        )
+        .returning(*ORDER_COLUMNS)
+        .cte('new_order')
     )
-    db.add(new_order)
+    stats = upsert_order_stats(
+        select(new_order.c.customer_id, new_order.c.vegetable_id, new_order.c.quantity, literal(1))
+    ).cte('new_order_stats')
+
+    try:
+        result = await db.execute(select(new_order).add_cte(stats))
+    except IntegrityError as exc:
+        await db.rollback()
+        _raise_missing_reference(exc)
+    new_order = build_from(Order, result.one())
     await db.commit() 
-    return new_order
+    row_counts.adjust(OrderDB.__tablename__, 1)
+    return ModelResponse(new_order)
     """
     return FullOrder(
         uuid=new_order.uuid,
@@ -120,6 +319,193 @@ async def create_order(
         )
     """
 
+@router.post('/bulk',response_model=BulkOrderResult,openapi_extra=BULK_ORDER_BODY)
+async def create_orders_bulk(
+    request: Request,
+    mode: Literal['atomic', 'partial'] = 'atomic',
+    db: AsyncSession = Depends(get_db)
+    ):
+    """
+    Массово создать заказы из JSON-массива или NDJSON.
+
+    atomic - при любой ошибке ничего не вставляется (422 со списком ошибок),
+    partial - вставляются корректные строки, ошибки возвращаются по индексам.
+    """
+    body = await request.body()
+    if 'ndjson' in request.headers.get('content-type', ''):
+        raw_items = [line for line in body.splitlines() if line.strip()]
+        validate = CreateOrder.model_validate_json
+    else:
+        try:
+            raw_items = json.loads(body)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON body")
+        if not isinstance(raw_items, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array of orders")
+        validate = CreateOrder.model_validate
+    if len(raw_items) > config.BULK_ORDERS_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Too many orders, max {config.BULK_ORDERS_MAX_ITEMS}")
+
+    errors = []
+    orders = []
+    for index, raw in enumerate(raw_items):
+        try:
+            orders.append((index, validate(raw)))
+        except ValidationError as exc:
+            errors.append(BulkOrderError(index=index, detail=_validation_detail(exc)))
+
+    # все ссылки проверяются одним запросом
+    customers, vegetables = await existing_references(
+        db,
+        {order.customer_id for _, order in orders},
+        {order.vegetable_id for _, order in orders},
+    )
+
+    records = []
+    deltas = {}
+    for index, order in orders:
+        if order.customer_id not in customers:
+            errors.append(BulkOrderError(index=index, detail="Customer not found"))
+            continue
+        if order.vegetable_id not in vegetables:
+            errors.append(BulkOrderError(index=index, detail="Vegetable not found"))
+            continue
+        records.append((uuid7(), order.vegetable_id, order.customer_id, order.quantity))
+        key = (order.customer_id, order.vegetable_id)
+        quantity, count = deltas.get(key, (0, 0))
+        deltas[key] = (quantity + order.quantity, count + 1)
+
+    errors.sort(key=lambda error: error.index)
+    if errors and mode == 'atomic':
+        raise HTTPException(status_code=422, detail=[error.model_dump() for error in errors])
+
+    if records:
+        try:
+            await insert_order_rows(db, records)
+            await apply_order_deltas(db, deltas)
+        except IntegrityError as exc:
+            # покупателя или овощ удалили между проверкой и вставкой
+            await db.rollback()
+            _raise_missing_reference(exc)
+        await db.commit()
+        row_counts.adjust(OrderDB.__tablename__, len(records))
+
+    return ModelResponse(build(
+        BulkOrderResult,
+        inserted=len(records),
+        items=[record[0] for record in records],
+        errors=errors
+    ))
+
+def _order_filter(
+    customer_id: Optional[UUID],
+    vegetable_id: Optional[UUID],
+    created_from: Optional[datetime],
+    created_to: Optional[datetime]
+    ) -> list:
+    """
+    Условия массовой операции; без фильтра операция по всей таблице запрещена
+    """
+    conditions = created_range(created_from, created_to)
+    if customer_id is not None:
+        conditions.append(OrderDB.customer_id == customer_id)
+    if vegetable_id is not None:
+        conditions.append(OrderDB.vegetable_id == vegetable_id)
+    if not conditions:
+        raise HTTPException(
+            status_code=400,
+            detail="At least one filter is required: customer_id, vegetable_id, created_from, created_to"
+        )
+    return conditions
+
+@router.delete('/',response_model=BulkOrderChange)
+async def delete_orders(
+    customer_id: Optional[UUID] = None,
+    vegetable_id: Optional[UUID] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    dry_run: bool = False,
+    db: AsyncSession = Depends(get_db)
+    ):
+    """
+    Удалить все заказы по фильтру пачками, dry_run - только посчитать
+    """
+    conditions = _order_filter(customer_id, vegetable_id, created_from, created_to)
+    if dry_run:
+        return ModelResponse(build(BulkOrderChange, affected=await count_orders_where(db, conditions), dry_run=True))
+
+    deleted = await delete_orders_where(db, conditions, config.ORDERS_BULK_CHUNK_SIZE)
+    row_counts.adjust(OrderDB.__tablename__, -deleted)
+    return ModelResponse(build(BulkOrderChange, affected=deleted, dry_run=False))
+
+@router.patch('/',response_model=BulkOrderChange)
+async def update_orders(
+    change: BulkOrderUpdate,
+    customer_id: Optional[UUID] = None,
+    vegetable_id: Optional[UUID] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    dry_run: bool = False,
+    db: AsyncSession = Depends(get_db)
+    ):
+    """
+    Изменить количество во всех заказах по фильтру пачками, dry_run - только посчитать
+    """
+    conditions = _order_filter(customer_id, vegetable_id, created_from, created_to)
+    if (change.quantity is None) == (change.quantity_delta is None):
+        raise HTTPException(status_code=400, detail="Exactly one of quantity, quantity_delta is required")
+    if dry_run:
+        return ModelResponse(build(BulkOrderChange, affected=await count_orders_where(db, conditions), dry_run=True))
+
+    if change.quantity is not None:
+        values = {'quantity': change.quantity}
+    else:
+        values = {'quantity': OrderDB.__table__.c.quantity + change.quantity_delta}
+    updated = await update_orders_where(db, conditions, values, config.ORDERS_BULK_CHUNK_SIZE)
+    return ModelResponse(build(BulkOrderChange, affected=updated, dry_run=False))
+
+async def _update_order(db: AsyncSession, order_id: str, values: dict):
+    """
+    Изменить заказ и агрегат customer_order_stats одним запросом
+    """
+    # старые значения нужны, чтобы вычесть их из агрегата
+    old_order = (
+        select(OrderDB.uuid, OrderDB.customer_id, OrderDB.vegetable_id, OrderDB.quantity)
+        .where(OrderDB.uuid == order_id)
+        .with_for_update()
+        .cte('old_order')
+    )
+    updated_order = (
+        update(OrderDB.__table__)
+        .where(OrderDB.uuid == old_order.c.uuid)
+        .values(**values)
+        .returning(*ORDER_COLUMNS)
+        .cte('updated_order')
+    )
+    # одна строка агрегата не может меняться дважды в одном запросе,
+    # поэтому разницы суммируются по ключу до upsert
+    deltas = union_all(
+        select(old_order.c.customer_id, old_order.c.vegetable_id, -old_order.c.quantity, literal(-1)),
+        select(updated_order.c.customer_id, updated_order.c.vegetable_id, updated_order.c.quantity, literal(1)),
+    ).subquery()
+    customer_id, vegetable_id, quantity, count = deltas.c
+    stats = upsert_order_stats(
+        select(customer_id, vegetable_id, func.sum(quantity), func.sum(count))
+        .group_by(customer_id, vegetable_id)
+    ).cte('updated_order_stats')
+
+    try:
+        result = await db.execute(select(updated_order).add_cte(stats))
+    except IntegrityError as exc:
+        await db.rollback()
+        _raise_missing_reference(exc)
+    row = result.one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    order_in_db = build_from(Order, row)
+    await db.commit()
+    return ModelResponse(order_in_db)
+
 @router.put('/{order_id}',response_model=Order)
 async def update_order(
     order_id: str,
@@ -129,16 +515,18 @@ async def update_order(
     """
     Обновить информацию о заказе
     """
-    result = await db.execute(select(OrderDB).where(OrderDB.uuid == order_id))
-    order_in_db = result.scalar_one_or_none()
-    if order_in_db is None:
-        raise HTTPException(status_code=404, detail="Order not found")
+    return await _update_order(db, order_id, order.model_dump())
 
-    order_in_db.customer_id = order.customer_id
-    order_in_db.vegetable_id = order.vegetable_id
-    order_in_db.quantity = order.quantity
-    await db.commit()
-    return order_in_db
+@router.patch('/{order_id}',response_model=Order)
+async def patch_order(
+    order_id: str,
+    order: PatchOrder,
+    db: AsyncSession = Depends(get_db)
+    ):
+    """
+    Изменить только переданные поля заказа
+    """
+    return await _update_order(db, order_id, patch_values(order))
 
 @router.delete("/{order_id}",response_model=DeleteOrder)
 async def delete_order(
@@ -148,18 +536,22 @@ async def delete_order(
     """
     Удалить заказ по UUID
     """
-    result = await db.execute(select(OrderDB).where(OrderDB.uuid == order_id))
-    order_in_db = result.scalar_one_or_none()
-    if order_in_db is None:
-        raise HTTPException(status_code=404, detail="Order not found")
-    order_data = Order(
-        uuid=order_in_db.uuid,
-        customer_id = order_in_db.customer_id,
-        vegetable_id = order_in_db.vegetable_id,
-        quantity = order_in_db.quantity
+    # заказ удаляется и вычитается из агрегата одним запросом
+    deleted_order = (
+        delete(OrderDB.__table__)
+        .where(OrderDB.uuid == order_id)
+        .returning(*ORDER_COLUMNS)
+        .cte('deleted_order')
     )
-    await db.delete(order_in_db)
-    await db.commit()
-    return DeleteOrder(message="Order deleted successfully",deleted_order=order_data)
-
+    stats = upsert_order_stats(
+        select(deleted_order.c.customer_id, deleted_order.c.vegetable_id, -deleted_order.c.quantity, literal(-1))
+    ).cte('deleted_order_stats')
 
+    result = await db.execute(select(deleted_order).add_cte(stats))
+    row = result.one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    order_data = build_from(Order, row)
+    await db.commit()
+    row_counts.adjust(OrderDB.__tablename__, -1)
+    return ModelResponse(build(DeleteOrder, message="Order deleted successfully", deleted_order=order_data))
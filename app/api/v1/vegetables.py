@@ -1,57 +1,139 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.db.base import get_db
-from fastapi import APIRouter, Depends, HTTPException
-from app.schemas.schemas import ListVegetable, Vegetable, CreateVegetable, UpdateVegetable, DeleteVegetable
+from app.db.base import get_db, get_read_db
+from app.api.pagination import paginate, split_page
+from app.api.export import export_response
+from app.db.counts import row_counts, table_count, query_count
+from app.db.cache import vegetable_cache
+from app.api.etag import row_version, make_etag, conditional_response
+from app.api.serialization import ModelResponse, build, build_from, to_json
+from app.api.fields import parse_fields, field_columns, build_item, build_page, patch_values
+from app.api.batch import fetch_by_ids
+from app.api.search import search_condition, search_order, check_search_cursor
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from app.schemas.schemas import ListVegetable, Vegetable, CreateVegetable, UpdateVegetable, PatchVegetable, DeleteVegetable, BatchVegetable, BatchGet
 from app.models.models import Vegetable as VegetableDB
-from sqlalchemy import select
+from app.db.errors import violated_foreign_key
+from sqlalchemy import select, update, delete
+from sqlalchemy.exc import IntegrityError
+from typing import Literal, Optional
 
 
 router = APIRouter()
 
+VEGETABLE_COLUMNS = (VegetableDB.uuid, VegetableDB.title, VegetableDB.weight, VegetableDB.price, VegetableDB.length)
+
 
 @router.get('/',response_model=ListVegetable)
 async def get_vegetables(   
-    db: AsyncSession = Depends(get_db),
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    count: Literal['exact', 'estimated', 'none'] = 'exact',
+    fields: Optional[str] = Query(None, description="Вернуть только эти поля: uuid,title"),
+    q: Optional[str] = Query(None, min_length=1, max_length=100, description="Поиск по названию: префикс или похожее написание"),
     ):
     """
     Получить список всех овощей
     """
-    result = await db.execute(select(VegetableDB).offset(skip).limit(limit))
-    items = result.scalars().all()
-    total = len(items)
-    
-    vegetable_list = [
-        Vegetable(
-            uuid=item.uuid,
-            title=item.title,
-            weight=item.weight,
-            price=item.price,
-            length=item.length
-        ) for item in items
-    ]
-    
-    return ListVegetable(
+    names = parse_fields(fields, Vegetable)
+    check_search_cursor(q, cursor)
+    cache_key = ('list', skip, limit, cursor, count, names, q)
+    cached = vegetable_cache.get(cache_key)
+    if cached is not None:
+        return conditional_response(request, *cached)
+    generation = vegetable_cache.generation
+
+    query = select(*field_columns(VegetableDB, Vegetable, names))
+    if q is not None:
+        query = query.where(search_condition(VegetableDB.title, q))
+        total = await query_count(db, query.with_only_columns(VegetableDB.uuid), count)
+        query = query.order_by(*search_order(VegetableDB.title, q))
+    else:
+        total = await table_count(db, VegetableDB, count)
+
+    result = await db.execute(
+        paginate(query.add_columns(row_version(VegetableDB)), VegetableDB.uuid, limit, skip, cursor)
+    )
+    rows, next_cursor = split_page(result.all(), limit)
+    if q is not None:
+        next_cursor = None
+    etag = make_etag(total, next_cursor, names, *(f'{row.uuid}:{row.row_version}' for row in rows))
+
+    vegetable_list = [build_item(Vegetable, row, names) for row in rows]
+
+    vegetable_page = build_page(
+        ListVegetable,
+        names,
         items=vegetable_list,
         total=total,
         limit=limit,
-        offset=skip
+        offset=skip if cursor is None else 0,
+        next_cursor=next_cursor
     )
+    # в кэше лежат готовые байты ответа, повторная сериализация не нужна
+    body = to_json(vegetable_page)
+    vegetable_cache.set(cache_key, (body, etag), generation)
+    for vegetable, row in zip(vegetable_list, rows):
+        vegetable_cache.set(('item', str(row.uuid), names), (to_json(vegetable), make_etag(row.uuid, row.row_version, names)), generation)
+    return conditional_response(request, body, etag)
+
+@router.get('/export')
+async def export_vegetables(
+    request: Request,
+    export_format: Literal['ndjson', 'csv'] = Query('ndjson', alias='format')
+    ):
+    """
+    Выгрузить все овощи потоком в NDJSON или CSV
+    """
+    return export_response(select(*VEGETABLE_COLUMNS), export_format, 'vegetables', request)
+
+@router.post('/batch-get',response_model=BatchVegetable)
+async def batch_get_vegetables(
+    batch: BatchGet,
+    fields: Optional[str] = Query(None, description="Вернуть только эти поля: uuid,title"),
+    db: AsyncSession = Depends(get_read_db)
+    ):
+    """
+    Получить несколько овощей по списку UUID одним запросом
+    """
+    names = parse_fields(fields, Vegetable)
+    rows, missing = await fetch_by_ids(db, field_columns(VegetableDB, Vegetable, names), VegetableDB.uuid, batch.ids)
+    return ModelResponse(build_page(
+        BatchVegetable,
+        names,
+        items=[build_item(Vegetable, row, names) for row in rows],
+        missing=missing
+    ))
 
 @router.get('/{vegetable_id}',response_model=Vegetable)
 async def get_vegetable(
     vegetable_id: str,
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    fields: Optional[str] = Query(None, description="Вернуть только эти поля: uuid,title"),
+    db: AsyncSession = Depends(get_read_db)
     ):
     """
     Получить овощ по UUID
     """
-    result = await db.execute(select(VegetableDB).where(VegetableDB.uuid == vegetable_id))
-    vegetable = result.scalar_one_or_none()
-    if vegetable is None:
+    names = parse_fields(fields, Vegetable)
+    cache_key = ('item', vegetable_id.lower(), names)
+    cached = vegetable_cache.get(cache_key)
+    if cached is not None:
+        return conditional_response(request, *cached)
+    generation = vegetable_cache.generation
+
+    result = await db.execute(
+        select(*field_columns(VegetableDB, Vegetable, names), row_version(VegetableDB)).where(VegetableDB.uuid == vegetable_id)
+    )
+    row = result.one_or_none()
+    if row is None:
         raise HTTPException(status_code=404, detail="Vegetable not found")
-    return vegetable
+    etag = make_etag(row.uuid, row.row_version, names)
+    body = to_json(build_item(Vegetable, row, names))
+    vegetable_cache.set(cache_key, (body, etag), generation)
+    return conditional_response(request, body, etag)
 
 @router.post('/',response_model=Vegetable)
 async def create_vegetable(
@@ -69,7 +151,27 @@ async def create_vegetable(
     )
     db.add(new_vegetable)
     await db.commit()
-    return new_vegetable
+    vegetable_cache.invalidate()
+    row_counts.adjust(VegetableDB.__tablename__, 1)
+    return ModelResponse(build_from(Vegetable, new_vegetable))
+
+async def _update_vegetable(db: AsyncSession, vegetable_id: str, values: dict):
+    """
+    Изменить овощ одним UPDATE ... RETURNING
+    """
+    result = await db.execute(
+        update(VegetableDB.__table__)
+        .where(VegetableDB.uuid == vegetable_id)
+        .values(**values)
+        .returning(*VEGETABLE_COLUMNS)
+    )
+    row = result.one_or_none()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Vegetable not found")
+    vegetable = build_from(Vegetable, row)
+    await db.commit()
+    vegetable_cache.invalidate()
+    return ModelResponse(vegetable)
 
 @router.put('/{vegetable_id}',response_model=Vegetable)
 async def update_vegetable(
@@ -80,16 +182,18 @@ async def update_vegetable(
     """
     Обновить информацию об овоще
     """
-    result = await db.execute(select(VegetableDB).where(VegetableDB.uuid == vegetable_id))
-    vegetable_in_db = result.scalar_one_or_none()
-    if vegetable_in_db is None:
-        raise HTTPException(status_code=404, detail="Vegetable not found")
-    vegetable_in_db.title = vegetable.title
-    vegetable_in_db.weight = vegetable.weight
-    vegetable_in_db.price = vegetable.price
-    vegetable_in_db.length = vegetable.length
-    await db.commit()
-    return vegetable_in_db
+    return await _update_vegetable(db, vegetable_id, vegetable.model_dump())
+
+@router.patch('/{vegetable_id}',response_model=Vegetable)
+async def patch_vegetable(
+    vegetable_id: str,
+    vegetable: PatchVegetable,
+    db: AsyncSession = Depends(get_db)
+    ):
+    """
+    Изменить только переданные поля овоща
+    """
+    return await _update_vegetable(db, vegetable_id, patch_values(vegetable))
 
 @router.delete('/{vegetable_id}',response_model=DeleteVegetable)
 async def delete_vegetable(
@@ -99,19 +203,22 @@ async def delete_vegetable(
     """
     Удалить овощ по UUID
     """
-    result = await db.execute(select(VegetableDB).where(VegetableDB.uuid == vegetable_id))
-    vegetable_in_db = result.scalar_one_or_none()
-    if vegetable_in_db is None:
+    try:
+        result = await db.execute(
+            delete(VegetableDB.__table__).where(VegetableDB.uuid == vegetable_id).returning(*VEGETABLE_COLUMNS)
+        )
+    except IntegrityError as exc:
+        await db.rollback()
+        if violated_foreign_key(exc) is None:
+            raise
+        raise HTTPException(status_code=409, detail="Vegetable has orders")
+    row = result.one_or_none()
+    if row is None:
         raise HTTPException(status_code=404, detail="Vegetable not found")
-    
-    vegetable_data = Vegetable(
-        uuid=vegetable_in_db.uuid,
-        title=vegetable_in_db.title,
-        weight=vegetable_in_db.weight,
-        price=vegetable_in_db.price,
-        length=vegetable_in_db.length
-    )
-    
-    await db.delete(vegetable_in_db)
+
+    vegetable_data = build_from(Vegetable, row)
+
     await db.commit()
-    return DeleteVegetable(message="Vegetable deleted successfully", deleted_vegetable=vegetable_data)
\ No newline at end of file
+    vegetable_cache.invalidate()
+    row_counts.adjust(VegetableDB.__tablename__, -1)
+    return ModelResponse(build(DeleteVegetable, message="Vegetable deleted successfully", deleted_vegetable=vegetable_data))
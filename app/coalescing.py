@@ -0,0 +1,124 @@
+import asyncio
+from typing import Optional
+from urllib.parse import parse_qsl
+
+import app.config as config
+from app.db.base import LAST_WRITE_COOKIE
+
+
+# объединяются только GET к API; выгрузки идут потоком и не буферизуются
+COALESCED_PATH_PREFIX = '/api/v1/'
+EXCLUDED_PATH_PREFIXES = ('/api/v1/internal/',)
+EXCLUDED_PATH_SUFFIXES = ('/export',)
+# заголовки, от которых зависит ответ (304 или 200, формат)
+KEY_HEADERS = (b'if-none-match', b'accept')
+
+
+def request_key(scope) -> Optional[tuple]:
+    """
+    Ключ одинаковых запросов: путь, параметры запроса и значимые заголовки.
+
+    Параметры сортируются по имени (повторы одного параметра сохраняют
+    порядок), поэтому ?limit=5&skip=0 и ?skip=0&limit=5 - один запрос.
+    None - запрос нельзя объединять.
+    """
+    path = scope['path']
+    if (
+        scope['method'] != 'GET'
+        or not path.startswith(COALESCED_PATH_PREFIX)
+        or path.startswith(EXCLUDED_PATH_PREFIXES)
+        or path.endswith(EXCLUDED_PATH_SUFFIXES)
+    ):
+        return None
+    headers = {}
+    for name, value in scope['headers']:
+        if name in KEY_HEADERS:
+            headers[name] = value
+        elif name == b'cookie' and f'{LAST_WRITE_COOKIE}='.encode() in value:
+            # клиент только что писал и читает с primary, чужой ответ с реплики ему не подходит
+            return None
+    query = parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True)
+    return (
+        path,
+        tuple(sorted(query, key=lambda item: item[0])),
+        tuple(headers.get(name) for name in KEY_HEADERS),
+    )
+
+
+class Flight:
+    """
+    Одно выполнение запроса, результат которого получают все присоединившиеся
+    """
+
+    __slots__ = ('generation', 'done', 'messages', 'route')
+
+    def __init__(self, generation: int):
+        self.generation = generation
+        self.done = asyncio.Event()
+        # ASGI-сообщения ответа, None - ответ нельзя раздавать
+        self.messages = None
+        self.route = None
+
+
+class SingleFlight:
+    """
+    Одинаковые одновременные запросы выполняются один раз (single-flight).
+
+    Первый запрос (ведущий) выполняется как обычно, остальные ждут его ответ
+    и получают копию. После завершения ответ ещё reuse_seconds отдаётся
+    повторным запросам. Любой изменяющий запрос процесса увеличивает
+    generation: к выполнениям, начатым до него, больше не присоединяются.
+    """
+
+    def __init__(self, reuse_seconds: float, max_body_bytes: int):
+        self.reuse_seconds = reuse_seconds
+        self.max_body_bytes = max_body_bytes
+        self.generation = 0
+        self.leaders = 0
+        self.coalesced = 0
+        self.reused = 0
+        self.fallbacks = 0
+        self._flights = {}
+
+    def join(self, key) -> tuple:
+        """
+        Вернуть (выполнение, ведущий ли запрос)
+        """
+        flight = self._flights.get(key)
+        if flight is not None and flight.generation == self.generation:
+            return flight, False
+        flight = self._flights[key] = Flight(self.generation)
+        self.leaders += 1
+        return flight, True
+
+    def finish(self, key, flight: Flight, messages, route):
+        flight.messages = messages
+        flight.route = route
+        flight.done.set()
+        if messages is None or self.reuse_seconds <= 0 or flight.generation != self.generation:
+            self._forget(key, flight)
+        else:
+            asyncio.get_running_loop().call_later(self.reuse_seconds, self._forget, key, flight)
+
+    def invalidate(self):
+        self.generation += 1
+        for key, flight in list(self._flights.items()):
+            if flight.done.is_set():
+                del self._flights[key]
+
+    def _forget(self, key, flight: Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self) -> dict:
+        return {
+            'in_flight': sum(1 for flight in self._flights.values() if not flight.done.is_set()),
+            'reuse_seconds': self.reuse_seconds,
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'reused': self.reused,
+            'fallbacks': self.fallbacks,
+        }
+
+
+request_flights = SingleFlight(config.COALESCE_REUSE_SECONDS, config.COALESCE_MAX_BODY_BYTES)
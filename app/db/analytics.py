@@ -0,0 +1,111 @@
+import asyncio
+import datetime
+import logging
+from typing import Optional
+
+from sqlalchemy import BigInteger, String, column, func, select, table, text
+from sqlalchemy.dialects.postgresql import UUID, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import app.config as config
+from app.db.base import AsyncSessionLocal
+from app.db.cache import analytics_cache
+from app.models.models import AnalyticsRefresh
+
+
+logger = logging.getLogger(__name__)
+
+# ключ pg_try_advisory_xact_lock: обновляет один процесс, остальные пропускают цикл
+ANALYTICS_LOCK_ID = 7_310_023
+
+# материализованные представления из миграций f3b8d2e6a417 и a8c1d5e2f934;
+# имена покупателей и овощей хранятся в них же, поэтому ответ не зависит от живых таблиц
+customer_sales = table(
+    'customer_sales',
+    column('customer_id', UUID(as_uuid=True)),
+    column('full_name', String),
+    column('total_quantity', BigInteger),
+    column('total_spend', BigInteger),
+    column('order_count', BigInteger),
+)
+vegetable_sales = table(
+    'vegetable_sales',
+    column('vegetable_id', UUID(as_uuid=True)),
+    column('title', String),
+    column('total_quantity', BigInteger),
+    column('order_count', BigInteger),
+    column('customer_count', BigInteger),
+    column('revenue', BigInteger),
+)
+
+ANALYTICS_VIEWS = (customer_sales.name, vegetable_sales.name)
+
+
+async def analytics_refreshed_at(db: AsyncSession):
+    """
+    Время самого старого из обновлений представлений, None - ещё не обновлялись
+    """
+    return await db.scalar(
+        select(func.min(AnalyticsRefresh.refreshed_at)).where(AnalyticsRefresh.view_name.in_(ANALYTICS_VIEWS))
+    )
+
+
+async def refresh_analytics(db: AsyncSession, min_interval: Optional[float] = None) -> bool:
+    """
+    Обновить представления аналитики (REFRESH MATERIALIZED VIEW CONCURRENTLY).
+
+    CONCURRENTLY не блокирует чтение во время обновления. Если другой процесс
+    уже обновляет или с прошлого обновления прошло меньше min_interval секунд,
+    ничего не делает. Возвращает True, если представления обновлены.
+    """
+    locked = await db.scalar(text('SELECT pg_try_advisory_xact_lock(:lock)'), {'lock': ANALYTICS_LOCK_ID})
+    if not locked:
+        await db.rollback()
+        return False
+    if min_interval:
+        fresh = await db.scalar(
+            select(func.count()).where(
+                AnalyticsRefresh.view_name.in_(ANALYTICS_VIEWS),
+                AnalyticsRefresh.refreshed_at > func.now() - datetime.timedelta(seconds=min_interval),
+            )
+        )
+        if fresh == len(ANALYTICS_VIEWS):
+            await db.rollback()
+            return False
+
+    for view in ANALYTICS_VIEWS:
+        await db.execute(text(f'REFRESH MATERIALIZED VIEW CONCURRENTLY {view}'))
+    stmt = pg_insert(AnalyticsRefresh).values([{'view_name': view} for view in ANALYTICS_VIEWS])
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[AnalyticsRefresh.view_name],
+        set_={'refreshed_at': func.now()},
+    ))
+    await db.commit()
+    analytics_cache.invalidate()
+    return True
+
+
+async def maintain_analytics():
+    """
+    Фоновая задача приложения: обновлять представления раз в ANALYTICS_REFRESH_SECONDS.
+
+    Воркеры и реплики приложения договариваются через advisory lock и время
+    последнего обновления, поэтому REFRESH выполняется один раз за интервал.
+    """
+    while True:
+        await asyncio.sleep(config.ANALYTICS_REFRESH_SECONDS)
+        try:
+            async with AsyncSessionLocal() as session:
+                await refresh_analytics(session, config.ANALYTICS_REFRESH_SECONDS * 0.9)
+        except Exception:
+            logger.exception('failed to refresh analytics views')
+
+
+async def main():
+    async with AsyncSessionLocal() as session:
+        await refresh_analytics(session)
+
+
+if __name__ == '__main__':
+    # python -m app.db.analytics
+    asyncio.run(main())
@@ -1,14 +1,52 @@
-from sqlalchemy.orm import sessionmaker
+import itertools
+import time
+from uuid import uuid4
+
+from fastapi import Request
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base 
 
 import app.config as config
+from app.db.pool import InstrumentedPool, worker_pool_limits
+from app.metrics import instrument_engine
 
 Base = declarative_base()
 
+
+def engine_options() -> dict:
+    """
+    Настройки пула и драйвера из app.config
+    """
+    connect_args = {}
+    if config.DB_PGBOUNCER:
+        # в режиме transaction PgBouncer может отдать следующий запрос другому
+        # серверному соединению, поэтому подготовленные выражения не кэшируются,
+        # а имена делаются уникальными
+        connect_args['statement_cache_size'] = 0
+        connect_args['prepared_statement_cache_size'] = 0
+        connect_args['prepared_statement_name_func'] = lambda: f'__asyncpg_{uuid4()}__'
+    else:
+        connect_args['prepared_statement_cache_size'] = config.DB_STATEMENT_CACHE_SIZE
+
+    pool_size, max_overflow = worker_pool_limits()
+    return dict(
+        poolclass=InstrumentedPool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=config.DB_POOL_TIMEOUT,
+        pool_recycle=config.DB_POOL_RECYCLE,
+        pool_pre_ping=config.DB_POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+
+
 engine = create_async_engine(
     config.SQLALCHEMY_DATABASE_URI,
+    **engine_options(),
 )
+instrument_engine(engine)
 
 AsyncSessionLocal = sessionmaker(
     engine,
@@ -27,4 +65,101 @@ async def get_db():
             await session.rollback()
             raise
         finally:
-            await session.close()
\ No newline at end of file
+            await session.close()
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.engine = create_async_engine(url, **engine_options())
+        instrument_engine(self.engine)
+        # до какого момента (time.monotonic) реплика считается недоступной
+        self.down_until = 0.0
+
+
+replicas = [Replica(url) for url in config.SQLALCHEMY_REPLICA_URIS]
+_replica_counter = itertools.count()
+
+LAST_WRITE_COOKIE = 'last_write'
+
+
+def recently_wrote(request: Request) -> bool:
+    """
+    Клиент недавно что-то изменил и должен видеть свои изменения (read-your-writes)
+    """
+    if config.READ_YOUR_WRITES_SECONDS <= 0:
+        return False
+    try:
+        last_write = float(request.cookies.get(LAST_WRITE_COOKIE, 0))
+    except ValueError:
+        return False
+    return time.time() - last_write < config.READ_YOUR_WRITES_SECONDS
+
+
+def read_replicas(request: Request = None) -> list:
+    """
+    Доступные реплики по кругу (round-robin), начиная со следующей
+    """
+    if not replicas or (request is not None and recently_wrote(request)):
+        return []
+    start = next(_replica_counter) % len(replicas)
+    now = time.monotonic()
+    return [replica for replica in replicas[start:] + replicas[:start] if replica.down_until <= now]
+
+
+class ReadSession(Session):
+    """
+    Сессия для чтения: выполняет запросы на первой доступной из candidates
+    реплике, а если все недоступны - на primary.
+
+    Соединение берётся из пула при первом запросе, а не при открытии сессии,
+    поэтому обработчик, ответивший из кэша или 304, соединение не занимает.
+    Реплика, к которой не удалось подключиться, помечается недоступной
+    на REPLICA_RETRY_SECONDS, и запрос повторяется на следующей.
+    """
+
+    def __init__(self, *args, candidates=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.candidates = list(candidates)
+
+    def get_bind(self, mapper=None, **kwargs):
+        if self.candidates:
+            return self.candidates[0].engine.sync_engine
+        return engine.sync_engine
+
+    def _connection_for_bind(self, bind, execution_options=None, **kwargs):
+        while self.candidates and bind is self.candidates[0].engine.sync_engine:
+            try:
+                return super()._connection_for_bind(bind, execution_options, **kwargs)
+            except (OSError, SQLAlchemyError):
+                replica = self.candidates.pop(0)
+                replica.down_until = time.monotonic() + config.REPLICA_RETRY_SECONDS
+                bind = self.get_bind()
+        return super()._connection_for_bind(bind, execution_options, **kwargs)
+
+
+ReadSessionLocal = sessionmaker(
+    engine,
+    class_=AsyncSession,
+    sync_session_class=ReadSession,
+    expire_on_commit=False,
+    autocommit=False,
+    autoflush=True,
+)
+
+
+def open_read_session(request: Request = None) -> AsyncSession:
+    """
+    Открыть сессию для чтения: на реплике, а если все недоступны - на primary
+    """
+    return ReadSessionLocal(candidates=read_replicas(request))
+
+
+async def get_read_db(request: Request):
+    async with open_read_session(request) as session:
+        try:
+            yield session
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
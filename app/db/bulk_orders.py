@@ -0,0 +1,151 @@
+import asyncpg
+from sqlalchemy import any_, bindparam, delete, func, insert, literal, select, union_all, update
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.order_stats import upsert_order_stats
+from app.models.models import Customer as CustomerDB, Order as OrderDB, Vegetable as VegetableDB
+
+
+ORDER_COPY_COLUMNS = ['uuid', 'vegetable_id', 'customer_id', 'quantity']
+
+
+async def existing_references(db: AsyncSession, customer_ids, vegetable_ids):
+    """
+    Одним запросом вернуть множества существующих покупателей и овощей.
+
+    Идентификаторы передаются массивом (uuid = ANY(:ids)), поэтому
+    размер запроса не зависит от количества заказов в пачке.
+    """
+    uuid_array = ARRAY(UUID(as_uuid=True))
+    query = union_all(
+        select(literal('customer').label('kind'), CustomerDB.uuid).where(
+            CustomerDB.uuid == any_(bindparam('customer_ids', list(customer_ids), type_=uuid_array))
+        ),
+        select(literal('vegetable').label('kind'), VegetableDB.uuid).where(
+            VegetableDB.uuid == any_(bindparam('vegetable_ids', list(vegetable_ids), type_=uuid_array))
+        ),
+    )
+    customers, vegetables = set(), set()
+    for kind, uuid in await db.execute(query):
+        (customers if kind == 'customer' else vegetables).add(uuid)
+    return customers, vegetables
+
+
+async def insert_order_rows(db: AsyncSession, records, batch_size: int = 5000):
+    """
+    Вставить заказы (uuid, vegetable_id, customer_id, quantity) в текущей транзакции.
+
+    Для asyncpg используется COPY (copy_records_to_table), для остальных
+    драйверов - executemany пачками по batch_size строк.
+    """
+    connection = await db.connection()
+    raw_connection = await connection.get_raw_connection()
+    driver_connection = raw_connection.driver_connection
+
+    if hasattr(driver_connection, 'copy_records_to_table'):
+        try:
+            await driver_connection.copy_records_to_table(
+                OrderDB.__tablename__,
+                records=records,
+                columns=ORDER_COPY_COLUMNS,
+            )
+        except asyncpg.IntegrityConstraintViolationError as exc:
+            # приводим к тому же исключению, что и запросы через SQLAlchemy
+            raise IntegrityError('COPY orders', None, exc) from exc
+        return
+
+    for start in range(0, len(records), batch_size):
+        await db.execute(
+            insert(OrderDB.__table__),
+            [dict(zip(ORDER_COPY_COLUMNS, record)) for record in records[start:start + batch_size]],
+        )
+
+
+async def count_orders_where(db: AsyncSession, conditions) -> int:
+    return await db.scalar(select(func.count()).select_from(OrderDB).where(*conditions))
+
+
+async def delete_orders_where(db: AsyncSession, conditions, chunk_size: int = 5000) -> int:
+    """
+    Удалить заказы по условию пачками по chunk_size строк, каждая пачка - один
+    запрос (DELETE ... RETURNING + вычитание из customer_order_stats) и свой commit,
+    чтобы большое удаление не держало блокировки до конца.
+
+    Возвращает число удалённых заказов.
+    """
+    orders = OrderDB.__table__
+    deleted_total = 0
+    while True:
+        batch = (
+            select(orders.c.uuid)
+            .where(*conditions)
+            .order_by(orders.c.uuid)
+            .limit(chunk_size)
+            .with_for_update()
+            .cte('batch')
+        )
+        deleted = (
+            delete(orders)
+            .where(orders.c.uuid == batch.c.uuid)
+            .returning(orders.c.customer_id, orders.c.vegetable_id, orders.c.quantity)
+            .cte('deleted')
+        )
+        stats = upsert_order_stats(
+            select(deleted.c.customer_id, deleted.c.vegetable_id, -func.sum(deleted.c.quantity), -func.count())
+            .group_by(deleted.c.customer_id, deleted.c.vegetable_id)
+        ).cte('deleted_stats')
+
+        deleted_count = await db.scalar(select(func.count()).select_from(deleted).add_cte(stats))
+        await db.commit()
+        deleted_total += deleted_count
+        if deleted_count < chunk_size:
+            return deleted_total
+
+
+async def update_orders_where(db: AsyncSession, conditions, values: dict, chunk_size: int = 5000) -> int:
+    """
+    Изменить заказы по условию пачками по chunk_size строк (seek по uuid),
+    каждая пачка - один запрос вместе с поправкой customer_order_stats и свой commit.
+
+    Возвращает число изменённых заказов.
+    """
+    orders = OrderDB.__table__
+    updated_total = 0
+    last_key = None
+    while True:
+        batch = select(orders.c.uuid, orders.c.customer_id, orders.c.vegetable_id, orders.c.quantity).where(*conditions)
+        if last_key is not None:
+            batch = batch.where(orders.c.uuid > last_key)
+        batch = batch.order_by(orders.c.uuid).limit(chunk_size).with_for_update().cte('batch')
+        updated = (
+            update(orders)
+            .where(orders.c.uuid == batch.c.uuid)
+            .values(**values)
+            .returning(orders.c.customer_id, orders.c.vegetable_id, orders.c.quantity)
+            .cte('updated')
+        )
+        # как и при изменении одного заказа: старые значения вычитаются, новые прибавляются
+        deltas = union_all(
+            select(batch.c.customer_id, batch.c.vegetable_id, -batch.c.quantity, literal(-1)),
+            select(updated.c.customer_id, updated.c.vegetable_id, updated.c.quantity, literal(1)),
+        ).subquery()
+        customer_id, vegetable_id, quantity, count = deltas.c
+        stats = upsert_order_stats(
+            select(customer_id, vegetable_id, func.sum(quantity), func.sum(count))
+            .group_by(customer_id, vegetable_id)
+        ).cte('updated_stats')
+
+        result = await db.execute(
+            select(
+                select(func.count()).select_from(batch).scalar_subquery(),
+                select(func.count()).select_from(updated).scalar_subquery(),
+                select(batch.c.uuid).order_by(batch.c.uuid.desc()).limit(1).scalar_subquery(),
+            ).add_cte(stats)
+        )
+        batch_count, updated_count, last_key = result.one()
+        await db.commit()
+        updated_total += updated_count
+        if batch_count < chunk_size:
+            return updated_total
@@ -0,0 +1,64 @@
+import time
+from collections import OrderedDict
+
+import app.config as config
+
+
+class TTLCache:
+    """
+    LRU-кэш в памяти процесса с ограничением размера и временем жизни записей.
+
+    Запись сохраняется только если с момента начала чтения из БД кэш не
+    инвалидировали (generation не изменился), иначе медленный запрос,
+    начатый до записи, положил бы в кэш устаревшие данные.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value, generation: int):
+        if generation != self.generation or self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self):
+        self.generation += 1
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+# справочник овощей: маленький, читается постоянно, меняется редко
+vegetable_cache = TTLCache(config.VEGETABLE_CACHE_SIZE, config.VEGETABLE_CACHE_TTL)
+
+# ответы аналитики: сбрасывается после REFRESH в этом процессе, иначе живёт ANALYTICS_CACHE_TTL
+analytics_cache = TTLCache(config.ANALYTICS_CACHE_SIZE, config.ANALYTICS_CACHE_TTL)
@@ -0,0 +1,89 @@
+import json
+import time
+from typing import Optional
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import app.config as config
+
+
+class RowCounts:
+    """
+    Точное число строк в таблицах без фильтра, закэшированное в процессе.
+
+    Обработчики записи сдвигают значение сразу после commit, а TTL ограничивает
+    расхождение из-за записей в других процессах.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._counts = {}
+
+    def get(self, table: str) -> Optional[int]:
+        entry = self._counts.get(table)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def set(self, table: str, count: int):
+        if self.ttl <= 0:
+            return
+        self._counts[table] = (time.monotonic() + self.ttl, count)
+
+    def adjust(self, table: str, delta: int):
+        entry = self._counts.get(table)
+        if entry is not None:
+            self._counts[table] = (entry[0], max(entry[1] + delta, 0))
+
+
+row_counts = RowCounts(config.ROW_COUNT_CACHE_TTL)
+
+
+async def table_count(db: AsyncSession, model, mode: str) -> Optional[int]:
+    """
+    Число строк в таблице без фильтра: exact - кэш или count(*),
+    estimated - pg_class.reltuples, none - не считать
+    """
+    table = model.__tablename__
+    if mode == 'none':
+        return None
+    if mode == 'estimated':
+        # у партиционированной таблицы (orders) строки только в партициях,
+        # для обычной pg_partition_tree возвращает саму таблицу
+        estimate = await db.scalar(
+            text(
+                "SELECT CASE WHEN bool_or(c.reltuples >= 0) THEN sum(greatest(c.reltuples, 0))::bigint END "
+                "FROM pg_partition_tree(CAST(:table AS regclass)) tree "
+                "JOIN pg_class c ON c.oid = tree.relid WHERE tree.isleaf"
+            ),
+            {'table': table},
+        )
+        # NULL: таблицу (ни одну партицию) ещё ни разу не анализировали
+        if estimate is not None:
+            return estimate
+
+    count = row_counts.get(table)
+    if count is None:
+        count = await db.scalar(select(func.count()).select_from(model))
+        row_counts.set(table, count)
+    return count
+
+
+async def query_count(db: AsyncSession, query, mode: str) -> Optional[int]:
+    """
+    Число строк отфильтрованного запроса: exact - count(*) по подзапросу,
+    estimated - оценка планировщика (EXPLAIN), none - не считать
+    """
+    if mode == 'none':
+        return None
+    if mode == 'estimated':
+        connection = await db.connection()
+        compiled = query.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True})
+        # exec_driver_sql: текст уже без параметров, text() принял бы ':' в литералах за параметры
+        result = await connection.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {compiled}')
+        plan = result.scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    return await db.scalar(select(func.count()).select_from(query.subquery()))
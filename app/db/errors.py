@@ -0,0 +1,19 @@
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+
+
+FOREIGN_KEY_VIOLATION = '23503'
+
+
+def violated_foreign_key(exc: IntegrityError) -> Optional[str]:
+    """
+    Вернуть имя нарушенного внешнего ключа, если ошибка - нарушение FK
+    """
+    orig = exc.orig
+    if getattr(orig, 'sqlstate', None) != FOREIGN_KEY_VIOLATION:
+        return None
+    # asyncpg кладёт исходное исключение с именем ограничения в __cause__,
+    # для ошибок COPY исключение драйвера передаётся напрямую
+    driver_error = orig.__cause__ if orig.__cause__ is not None else orig
+    return getattr(driver_error, 'constraint_name', None) or ''
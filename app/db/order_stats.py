@@ -0,0 +1,89 @@
+import asyncio
+
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.base import AsyncSessionLocal
+from app.models.models import CustomerOrderStats, Order as OrderDB
+
+
+def _merge_on_conflict(stmt):
+    return stmt.on_conflict_do_update(
+        index_elements=[CustomerOrderStats.customer_id, CustomerOrderStats.vegetable_id],
+        set_={
+            'total_quantity': CustomerOrderStats.total_quantity + stmt.excluded.total_quantity,
+            'order_count': CustomerOrderStats.order_count + stmt.excluded.order_count,
+        },
+    )
+
+
+def upsert_order_stats(source):
+    """
+    INSERT ... SELECT в customer_order_stats с прибавлением к существующим значениям.
+
+    source должен возвращать (customer_id, vegetable_id, total_quantity, order_count).
+    Выражение можно вложить в CTE вместе с изменением orders, чтобы заказ
+    и агрегат менялись одним запросом.
+    """
+    return _merge_on_conflict(
+        pg_insert(CustomerOrderStats).from_select(
+            ['customer_id', 'vegetable_id', 'total_quantity', 'order_count'],
+            source,
+        )
+    )
+
+
+async def apply_order_deltas(db: AsyncSession, deltas: dict, chunk_size: int = 5000):
+    """
+    Применить пачку изменений {(customer_id, vegetable_id): (quantity, count)}
+    в текущей транзакции.
+
+    Вызывается из обработчиков заказов до commit, поэтому агрегат
+    фиксируется или откатывается вместе с самими заказами.
+    Строки с order_count = 0 остаются до пересчёта и не учитываются фильтром.
+    """
+    rows = [
+        {
+            'customer_id': customer_id,
+            'vegetable_id': vegetable_id,
+            'total_quantity': quantity,
+            'order_count': count,
+        }
+        for (customer_id, vegetable_id), (quantity, count) in deltas.items()
+    ]
+    # в одном запросе не больше 32767 параметров
+    for start in range(0, len(rows), chunk_size):
+        stmt = pg_insert(CustomerOrderStats).values(rows[start:start + chunk_size])
+        await db.execute(_merge_on_conflict(stmt))
+
+
+async def rebuild_order_stats(db: AsyncSession):
+    """
+    Пересчитать customer_order_stats целиком по таблице orders
+    """
+    # блокируем запись в orders, чтобы не потерять изменения, сделанные во время пересчёта
+    await db.execute(text("LOCK TABLE orders IN SHARE MODE"))
+    await db.execute(delete(CustomerOrderStats))
+    await db.execute(
+        insert(CustomerOrderStats).from_select(
+            ['customer_id', 'vegetable_id', 'total_quantity', 'order_count'],
+            select(
+                OrderDB.customer_id,
+                OrderDB.vegetable_id,
+                func.sum(OrderDB.quantity),
+                func.count(),
+            ).group_by(OrderDB.customer_id, OrderDB.vegetable_id),
+        )
+    )
+    await db.commit()
+
+
+async def main():
+    async with AsyncSessionLocal() as session:
+        await rebuild_order_stats(session)
+
+
+if __name__ == '__main__':
+    # python -m app.db.order_stats
+    asyncio.run(main())
@@ -0,0 +1,203 @@
+import argparse
+import asyncio
+import datetime
+import logging
+import re
+from typing import Optional
+
+from sqlalchemy import column, func, select, table, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import app.config as config
+from app.db.base import AsyncSessionLocal
+from app.db.order_stats import upsert_order_stats
+from app.models.models import Order as OrderDB
+
+
+logger = logging.getLogger(__name__)
+
+# ключ pg_advisory_xact_lock: партиции меняет один процесс за раз
+PARTITIONS_LOCK_ID = 7_310_022
+
+PARTITION_BOUND = re.compile(r"FROM \((?:'([^']+)'|MINVALUE)\) TO \((?:'([^']+)'|MAXVALUE)\)")
+
+
+def partition_name(month: datetime.date) -> str:
+    return f'orders_y{month.year:04d}m{month.month:02d}'
+
+
+def month_start(value: datetime.date) -> datetime.date:
+    return datetime.date(value.year, value.month, 1)
+
+
+def add_months(month: datetime.date, months: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def _utc(value: datetime.date) -> datetime.datetime:
+    return datetime.datetime(value.year, value.month, value.day, tzinfo=datetime.timezone.utc)
+
+
+def created_range(created_from: Optional[datetime.datetime], created_to: Optional[datetime.datetime]) -> list:
+    """
+    Условия по orders.created_at: [created_from, created_to). По ним Postgres
+    отсекает партиции, не пересекающиеся с периодом. Время без зоны считается UTC.
+    """
+    conditions = []
+    if created_from is not None:
+        if created_from.tzinfo is None:
+            created_from = created_from.replace(tzinfo=datetime.timezone.utc)
+        conditions.append(OrderDB.created_at >= created_from)
+    if created_to is not None:
+        if created_to.tzinfo is None:
+            created_to = created_to.replace(tzinfo=datetime.timezone.utc)
+        conditions.append(OrderDB.created_at < created_to)
+    return conditions
+
+
+async def order_partitions(db: AsyncSession) -> list:
+    """
+    Партиции orders: [(имя, нижняя граница или None, верхняя граница или None, default)]
+    """
+    result = await db.execute(text(
+        """
+        SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = 'orders'
+        ORDER BY child.relname
+        """
+    ))
+    partitions = []
+    for name, bound in result:
+        match = PARTITION_BOUND.search(bound)
+        if match is None:
+            partitions.append((name, None, None, True))
+            continue
+        lower, upper = (
+            datetime.datetime.fromisoformat(value) if value else None
+            for value in match.groups()
+        )
+        partitions.append((name, lower, upper, False))
+    return partitions
+
+
+async def ensure_order_partitions(
+    db: AsyncSession,
+    months_ahead: int,
+    today: Optional[datetime.date] = None,
+    months_back: int = 0,
+) -> list:
+    """
+    Создать недостающие помесячные партиции от months_back месяцев назад
+    до months_ahead месяцев вперёд от текущего.
+
+    Месяцы, уже покрытые другой партицией (например, orders_legacy после миграции),
+    пропускаются. Возвращает имена созданных партиций.
+    """
+    await db.execute(text('SELECT pg_advisory_xact_lock(:lock)'), {'lock': PARTITIONS_LOCK_ID})
+    ranges = [
+        (lower, upper) for _, lower, upper, is_default in await order_partitions(db) if not is_default
+    ]
+    created = []
+    first = month_start(today or datetime.datetime.now(datetime.timezone.utc).date())
+    for offset in range(-months_back, months_ahead + 1):
+        start, end = _utc(add_months(first, offset)), _utc(add_months(first, offset + 1))
+        overlaps = any(
+            (lower is None or lower < end) and (upper is None or start < upper)
+            for lower, upper in ranges
+        )
+        if overlaps:
+            continue
+        name = partition_name(start.date())
+        # если строки этого месяца уже попали в orders_default, Postgres откажет - их нужно перенести вручную
+        await db.execute(text(
+            f"CREATE TABLE {name} PARTITION OF orders "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+        ranges.append((start, end))
+        created.append(name)
+    await db.commit()
+    return created
+
+
+async def detach_order_partitions(db: AsyncSession, before: datetime.date, drop: bool = False) -> list:
+    """
+    Отсоединить (и при drop=True удалить) партиции, целиком лежащие раньше before.
+
+    Заказы отсоединяемой партиции вычитаются из customer_order_stats в той же
+    транзакции, что и DETACH, под блокировкой партиции от записи, поэтому
+    агрегаты остаются согласованными с orders.
+    Каждая партиция - отдельная транзакция.
+    """
+    boundary = _utc(before)
+    detached = []
+    for name, _, upper, is_default in await order_partitions(db):
+        if is_default or upper is None or upper > boundary:
+            continue
+        await db.execute(text('SELECT pg_advisory_xact_lock(:lock)'), {'lock': PARTITIONS_LOCK_ID})
+        # запись в партицию ждёт до конца транзакции, иначе заказ, изменённый между
+        # подсчётом и DETACH, вычелся бы из агрегата дважды или не вычелся вовсе
+        await db.execute(text(f'LOCK TABLE {name} IN SHARE MODE'))
+        partition = table(name, column('customer_id'), column('vegetable_id'), column('quantity'))
+        await db.execute(upsert_order_stats(
+            select(
+                partition.c.customer_id,
+                partition.c.vegetable_id,
+                -func.sum(partition.c.quantity),
+                -func.count(),
+            ).group_by(partition.c.customer_id, partition.c.vegetable_id)
+        ))
+        await db.execute(text(f'ALTER TABLE orders DETACH PARTITION {name}'))
+        if drop:
+            await db.execute(text(f'DROP TABLE {name}'))
+        await db.commit()
+        detached.append(name)
+    return detached
+
+
+async def maintain_order_partitions():
+    """
+    Фоновая задача приложения: периодически создавать партиции на будущие месяцы
+    """
+    while True:
+        try:
+            async with AsyncSessionLocal() as session:
+                created = await ensure_order_partitions(session, config.ORDER_PARTITIONS_AHEAD)
+            if created:
+                logger.info('created order partitions: %s', ', '.join(created))
+        except Exception:
+            logger.exception('failed to create order partitions')
+        await asyncio.sleep(config.ORDER_PARTITIONS_CHECK_SECONDS)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Партиции таблицы orders')
+    commands = parser.add_subparsers(dest='command', required=True)
+    ensure = commands.add_parser('ensure', help='создать партиции на будущие месяцы')
+    ensure.add_argument('--months-ahead', type=int, default=config.ORDER_PARTITIONS_AHEAD)
+    detach = commands.add_parser('detach', help='отсоединить партиции раньше даты')
+    detach.add_argument('--before', type=datetime.date.fromisoformat, required=True, help='YYYY-MM-DD')
+    detach.add_argument('--drop', action='store_true', help='удалить отсоединённые партиции')
+    commands.add_parser('list', help='показать партиции')
+    args = parser.parse_args()
+
+    async with AsyncSessionLocal() as session:
+        if args.command == 'ensure':
+            names = await ensure_order_partitions(session, args.months_ahead)
+        elif args.command == 'detach':
+            names = await detach_order_partitions(session, args.before, args.drop)
+        else:
+            names = [
+                f'{name}: DEFAULT' if is_default else f'{name}: {lower or "MINVALUE"} .. {upper or "MAXVALUE"}'
+                for name, lower, upper, is_default in await order_partitions(session)
+            ]
+    for name in names:
+        print(name)
+
+
+if __name__ == '__main__':
+    # python -m app.db.partitions ensure | detach --before 2025-01-01 [--drop] | list
+    asyncio.run(main())
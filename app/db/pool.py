@@ -0,0 +1,70 @@
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+import app.config as config
+from app.metrics import Histogram
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Очередь соединений, которая измеряет время ожидания свободного соединения
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_histogram = Histogram()
+        self.timeouts = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            self.wait_histogram.observe(time.perf_counter() - started)
+
+    def recreate(self):
+        # pool.recreate() (например после dispose) не должен терять счётчики
+        pool = super().recreate()
+        pool.wait_histogram = self.wait_histogram
+        pool.timeouts = self.timeouts
+        return pool
+
+
+def pool_stats(engine) -> dict:
+    pool = engine.pool
+    stats = {
+        'size': pool.size(),
+        'checked_out': pool.checkedout(),
+        'idle': pool.checkedin(),
+        'overflow': max(pool.overflow(), 0),
+    }
+    if isinstance(pool, InstrumentedPool):
+        stats['timeouts'] = pool.timeouts
+        stats['wait_seconds'] = pool.wait_histogram.snapshot()
+    return stats
+
+
+def worker_pool_limits() -> tuple:
+    """
+    (pool_size, max_overflow) пула одного воркера.
+
+    При DB_CONNECTION_BUDGET pool_size + max_overflow не больше
+    DB_CONNECTION_BUDGET // WEB_CONCURRENCY, поэтому все воркеры вместе
+    не откроют больше соединений, чем позволяет бюджет.
+    """
+    if config.DB_CONNECTION_BUDGET <= 0:
+        return config.DB_POOL_SIZE, config.DB_MAX_OVERFLOW
+    workers = max(config.WEB_CONCURRENCY, 1)
+    per_worker = config.DB_CONNECTION_BUDGET // workers
+    if per_worker < 1:
+        raise ValueError(
+            f'DB_CONNECTION_BUDGET={config.DB_CONNECTION_BUDGET} is less than the number of workers ({workers})'
+        )
+    pool_size = min(config.DB_POOL_SIZE, per_worker)
+    max_overflow = max(min(config.DB_MAX_OVERFLOW, per_worker - pool_size), 0)
+    return pool_size, max_overflow
@@ -1,9 +1,45 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.api.v1 import customers, vegetables, orders
+from app.api.v1 import customers, vegetables, orders, analytics, internal
+from app.middleware import CoalescingMiddleware, MetricsMiddleware, ReadYourWritesMiddleware
+from app.coalescing import request_flights
+from app.metrics import render_metrics
+from app.db.base import engine, replicas
+from app.db.cache import vegetable_cache, analytics_cache
+from app.db.partitions import maintain_order_partitions
+from app.db.analytics import maintain_analytics
+import app.config as config
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tasks = []
+    # партиции orders на следующие месяцы создаются заранее, см. app.db.partitions
+    if config.ORDER_PARTITIONS_CHECK_SECONDS > 0:
+        tasks.append(asyncio.create_task(maintain_order_partitions()))
+    # обновление представлений аналитики, см. app.db.analytics
+    if config.ANALYTICS_REFRESH_SECONDS > 0:
+        tasks.append(asyncio.create_task(maintain_analytics()))
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# внутри MetricsMiddleware: объединённые запросы тоже попадают в метрики маршрута
+if config.COALESCE_REQUESTS:
+    app.add_middleware(CoalescingMiddleware)
+app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -28,4 +64,51 @@ app.include_router(orders.router,
                    prefix='/api/v1/orders', 
                    tags=['orders']
                    )
-                   
\ No newline at end of file
+                   
+
+app.include_router(analytics.router, 
+                   prefix='/api/v1/analytics', 
+                   tags=['analytics']
+                   )
+
+
+app.include_router(internal.router, 
+                   prefix='/api/v1/internal', 
+                   tags=['internal']
+                   )
+
+
+@app.get('/metrics', include_in_schema=False)
+async def metrics():
+    """
+    Метрики в текстовом формате Prometheus
+    """
+    pools = {'primary': engine}
+    for index, replica in enumerate(replicas):
+        pools[f'replica{index}'] = replica.engine
+    return PlainTextResponse(
+        render_metrics(pools, {'vegetables': vegetable_cache, 'analytics': analytics_cache}, request_flights),
+        media_type='text/plain; version=0.0.4'
+    )
+
+
+@app.get('/healthz', include_in_schema=False)
+async def healthz():
+    """
+    Процесс жив и отвечает, база не проверяется
+    """
+    return {'status': 'ok'}
+
+
+@app.get('/readyz', include_in_schema=False)
+async def readyz():
+    """
+    Готов принимать запросы: primary отвечает на SELECT 1
+    """
+    try:
+        async with asyncio.timeout(config.READYZ_TIMEOUT):
+            async with engine.connect() as connection:
+                await connection.execute(text('SELECT 1'))
+    except (OSError, SQLAlchemyError, TimeoutError):
+        return JSONResponse({'status': 'unavailable'}, status_code=503)
+    return {'status': 'ready'}
@@ -0,0 +1,160 @@
+import bisect
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+    Гистограмма длительностей с фиксированными границами корзин (в секундах).
+
+    observe() - O(log n) без аллокаций, чтобы запись была дешёвой на горячем пути.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> dict:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            buckets['+Inf' if bound == float('inf') else str(bound)] = cumulative
+        return {'buckets': buckets, 'sum': self.sum, 'count': self.count}
+
+
+# метрики запросов: (method, route, status) -> Histogram
+request_durations = {}
+# метрики SQL: (method, route) -> Histogram длительностей отдельных выражений
+sql_durations = {}
+
+# выражения SQL, выполненные в рамках текущего HTTP-запроса
+current_sql_timings = ContextVar('current_sql_timings', default=None)
+
+
+def observe_request(method: str, route: str, status: int, duration: float, sql_timings):
+    histogram = request_durations.get((method, route, status))
+    if histogram is None:
+        histogram = request_durations[(method, route, status)] = Histogram()
+    histogram.observe(duration)
+
+    if sql_timings:
+        histogram = sql_durations.get((method, route))
+        if histogram is None:
+            histogram = sql_durations[(method, route)] = Histogram()
+        for value in sql_timings:
+            histogram.observe(value)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timings = current_sql_timings.get()
+    started = getattr(context, '_metrics_started', None)
+    if timings is not None and started is not None:
+        timings.append(time.perf_counter() - started)
+
+
+def instrument_engine(engine):
+    """
+    Считать время SQL-выражений движка и относить их к текущему маршруту
+    """
+    sync_engine = getattr(engine, 'sync_engine', engine)
+    event.listen(sync_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(sync_engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels) -> str:
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+
+
+def _render_histogram(lines, name: str, histogram: Histogram, **labels):
+    snapshot = histogram.snapshot()
+    prefix = _labels(**labels)
+    separator = ',' if prefix else ''
+    for bound, count in snapshot['buckets'].items():
+        lines.append(f'{name}_bucket{{{prefix}{separator}le="{bound}"}} {count}')
+    lines.append(f'{name}_sum{{{prefix}}} {snapshot["sum"]}')
+    lines.append(f'{name}_count{{{prefix}}} {snapshot["count"]}')
+
+
+def render_metrics(pools=None, caches=None, flights=None) -> str:
+    """
+    Все метрики в текстовом формате Prometheus.
+
+    pools - {имя: engine}, caches - {имя: TTLCache}, flights - SingleFlight.
+    """
+    lines = [
+        '# HELP http_request_duration_seconds HTTP request duration by route template and status.',
+        '# TYPE http_request_duration_seconds histogram',
+    ]
+    for (method, route, status), histogram in list(request_durations.items()):
+        _render_histogram(lines, 'http_request_duration_seconds', histogram, method=method, route=route, status=status)
+
+    lines += [
+        '# HELP db_statement_duration_seconds SQL statement duration by method and route template.',
+        '# TYPE db_statement_duration_seconds histogram',
+    ]
+    for (method, route), histogram in list(sql_durations.items()):
+        _render_histogram(lines, 'db_statement_duration_seconds', histogram, method=method, route=route)
+
+    lines += [
+        '# HELP db_statements_total SQL statements executed by method and route template.',
+        '# TYPE db_statements_total counter',
+    ]
+    for (method, route), histogram in list(sql_durations.items()):
+        lines.append(f'db_statements_total{{{_labels(method=method, route=route)}}} {histogram.count}')
+
+    if pools:
+        gauges = (('checked_out', 'checkedout'), ('idle', 'checkedin'), ('size', 'size'))
+        for gauge, method in gauges:
+            lines += [f'# TYPE db_pool_{gauge} gauge']
+            for name, engine in pools.items():
+                lines.append(f'db_pool_{gauge}{{{_labels(pool=name)}}} {getattr(engine.pool, method)()}')
+        lines += ['# TYPE db_pool_overflow gauge']
+        for name, engine in pools.items():
+            lines.append(f'db_pool_overflow{{{_labels(pool=name)}}} {max(engine.pool.overflow(), 0)}')
+        lines += [
+            '# HELP db_pool_wait_seconds Time spent waiting for a pooled connection.',
+            '# TYPE db_pool_wait_seconds histogram',
+        ]
+        for name, engine in pools.items():
+            histogram = getattr(engine.pool, 'wait_histogram', None)
+            if histogram is not None:
+                _render_histogram(lines, 'db_pool_wait_seconds', histogram, pool=name)
+
+    if caches:
+        for counter in ('hits', 'misses'):
+            lines += [f'# TYPE cache_{counter}_total counter']
+            for name, cache in caches.items():
+                lines.append(f'cache_{counter}_total{{{_labels(cache=name)}}} {getattr(cache, counter)}')
+
+    if flights is not None:
+        lines += [
+            '# HELP http_coalesced_requests_total GET requests by single-flight outcome (leaders executed, the rest shared a response).',
+            '# TYPE http_coalesced_requests_total counter',
+        ]
+        for outcome in ('leaders', 'coalesced', 'reused', 'fallbacks'):
+            lines.append(f'http_coalesced_requests_total{{{_labels(outcome=outcome)}}} {getattr(flights, outcome)}')
+        lines += ['# TYPE http_coalesced_in_flight gauge', f'http_coalesced_in_flight {flights.stats()["in_flight"]}']
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,165 @@
+import math
+import time
+
+from starlette.datastructures import MutableHeaders
+
+import app.config as config
+from app.coalescing import request_flights, request_key
+from app.db.base import LAST_WRITE_COOKIE, replicas
+from app.metrics import current_sql_timings, observe_request
+
+
+SAFE_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS'))
+# POST-эндпоинты, которые только читают (тело запроса - список id)
+READ_ONLY_PATH_SUFFIXES = ('/batch-get',)
+
+
+class ReadYourWritesMiddleware:
+    """
+    После успешного изменяющего запроса ставит клиенту cookie с временем записи,
+    чтобы get_read_db какое-то время читал для него с primary, а не с реплики
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope['type'] != 'http'
+            or scope['method'] in SAFE_METHODS
+            or scope['path'].endswith(READ_ONLY_PATH_SUFFIXES)
+            or not replicas
+            or config.READ_YOUR_WRITES_SECONDS <= 0
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_cookie(message):
+            if message['type'] == 'http.response.start' and message['status'] < 400:
+                headers = MutableHeaders(scope=message)
+                headers.append(
+                    'set-cookie',
+                    f'{LAST_WRITE_COOKIE}={time.time():.3f}; '
+                    f'Max-Age={math.ceil(config.READ_YOUR_WRITES_SECONDS)}; Path=/; HttpOnly; SameSite=Lax',
+                )
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+
+def _copy_message(message: dict) -> dict:
+    # внешние middleware (CORS) дописывают заголовки в сообщение на месте
+    if message['type'] == 'http.response.start':
+        return {**message, 'headers': list(message['headers'])}
+    return dict(message)
+
+
+class CoalescingMiddleware:
+    """
+    Одинаковые одновременные GET-запросы выполняются один раз, остальные
+    получают копию ответа (app.coalescing.SingleFlight).
+
+    Изменяющие запросы после завершения сбрасывают сохранённые ответы.
+    """
+
+    def __init__(self, app, flights=request_flights):
+        self.app = app
+        self.flights = flights
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        if scope['method'] not in SAFE_METHODS and not scope['path'].endswith(READ_ONLY_PATH_SUFFIXES):
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                self.flights.invalidate()
+            return
+
+        key = request_key(scope)
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        flight, leader = self.flights.join(key)
+        if leader:
+            await self._lead(key, flight, scope, receive, send)
+            return
+
+        reused = flight.done.is_set()
+        await flight.done.wait()
+        if flight.messages is None:
+            # ведущий запрос упал или ответ слишком большой
+            self.flights.fallbacks += 1
+            await self.app(scope, receive, send)
+            return
+        if reused:
+            self.flights.reused += 1
+        else:
+            self.flights.coalesced += 1
+        # маршрут ведущего запроса, чтобы метрики относились к тому же шаблону
+        scope['route'] = flight.route
+        for message in flight.messages:
+            message = _copy_message(message)
+            if message['type'] == 'http.response.start':
+                message['headers'].append((b'x-coalesced', b'reused' if reused else b'coalesced'))
+            await send(message)
+
+    async def _lead(self, key, flight, scope, receive, send):
+        messages = []
+        size = 0
+
+        async def send_and_capture(message):
+            nonlocal messages, size
+            if messages is not None:
+                if message['type'] == 'http.response.start' and message['status'] >= 500:
+                    messages = None
+                elif message['type'] == 'http.response.body':
+                    size += len(message.get('body', b''))
+                    if size > self.flights.max_body_bytes:
+                        messages = None
+                if messages is not None:
+                    messages.append(_copy_message(message))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_and_capture)
+        except BaseException:
+            messages = None
+            raise
+        finally:
+            self.flights.finish(key, flight, messages, scope.get('route'))
+
+
+class MetricsMiddleware:
+    """
+    Время обработки запроса и SQL-выражений по шаблону маршрута и статусу
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        timings = []
+        token = current_sql_timings.set(timings)
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            current_sql_timings.reset(token)
+            route = scope.get('route')
+            # шаблон вида /api/v1/customers/{customer_id}, а не конкретный путь
+            route_path = getattr(route, 'path', None) or 'unmatched'
+            observe_request(scope['method'], route_path, status, time.perf_counter() - started, timings)
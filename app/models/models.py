@@ -1,5 +1,5 @@
 
-from sqlalchemy import Column, String, DateTime, ForeignKey, text,Integer
+from sqlalchemy import Column, String, DateTime, ForeignKey, text,Integer, BigInteger, Index
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -9,28 +9,65 @@ from app.db.base import Base
 class Customer(Base):
     __tablename__ = 'customers'
 
-    uuid = Column(UUID(as_uuid=True), primary_key=True, nullable=False, server_default=text("gen_random_uuid()"))
+    uuid = Column(UUID(as_uuid=True), primary_key=True, nullable=False, server_default=text("uuid_generate_v7()"))
     full_name = Column(String, nullable=False)
     date_created = Column(DateTime, default=datetime.now)
 
+    __table_args__ = (
+        # поиск ?q= по имени (pg_trgm)
+        Index('ix_customers_full_name_trgm', 'full_name', postgresql_using='gin', postgresql_ops={'full_name': 'gin_trgm_ops'}),
+    )
+
 class Vegetable(Base):
     __tablename__ = 'vegetables'
 
-    uuid = Column(UUID(as_uuid=True), primary_key=True, nullable=False, server_default=text("gen_random_uuid()"))
+    uuid = Column(UUID(as_uuid=True), primary_key=True, nullable=False, server_default=text("uuid_generate_v7()"))
     title = Column(String, nullable=False)
     weight = Column(Integer, nullable=False)
     price = Column(Integer, nullable=False)
     length = Column(Integer, nullable=False)
 
+    __table_args__ = (
+        # поиск ?q= по названию (pg_trgm)
+        Index('ix_vegetables_title_trgm', 'title', postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'}),
+    )
+
 class Order(Base):
     __tablename__ = 'orders'
 
-    uuid = Column(UUID(as_uuid=True), primary_key=True, nullable=False, server_default=text("gen_random_uuid()"))
+    uuid = Column(UUID(as_uuid=True), primary_key=True, nullable=False, server_default=text("uuid_generate_v7()"))
     vegetable_id = Column(UUID(as_uuid=True), ForeignKey('vegetables.uuid'), nullable=False)
     customer_id = Column(UUID(as_uuid=True), ForeignKey('customers.uuid'), nullable=False)
     quantity = Column(Integer, nullable=False)
+    # ключ помесячных партиций, поэтому входит в первичный ключ
+    created_at = Column(DateTime(timezone=True), primary_key=True, nullable=False, server_default=text("now()"))
 
     customer = relationship("Customer", backref="orders")
     vegetable = relationship("Vegetable", backref="orders")
 
+    __table_args__ = (
+        # внешние ключи и выборки по покупателю / овощу
+        Index('ix_orders_customer_vegetable', 'customer_id', 'vegetable_id', postgresql_include=['quantity']),
+        Index('ix_orders_vegetable_customer', 'vegetable_id', 'customer_id', postgresql_include=['quantity']),
+        # выборки за период внутри партиции и в orders_default
+        Index('ix_orders_created_at', 'created_at'),
+        # партиции по месяцам: app.db.partitions и миграция e6f1a8b3c529
+        {'postgresql_partition_by': 'RANGE (created_at)'},
+    )
+
+
+class CustomerOrderStats(Base):
+    __tablename__ = 'customer_order_stats'
+
+    customer_id = Column(UUID(as_uuid=True), ForeignKey('customers.uuid', ondelete='CASCADE'), primary_key=True, nullable=False)
+    vegetable_id = Column(UUID(as_uuid=True), ForeignKey('vegetables.uuid', ondelete='CASCADE'), primary_key=True, nullable=False)
+    total_quantity = Column(BigInteger, nullable=False, server_default=text("0"))
+    order_count = Column(Integer, nullable=False, server_default=text("0"))
+
+
+class AnalyticsRefresh(Base):
+    __tablename__ = 'analytics_refreshes'
 
+    # время последнего REFRESH материализованных представлений аналитики (app.db.analytics)
+    view_name = Column(String, primary_key=True, nullable=False)
+    refreshed_at = Column(DateTime(timezone=True), nullable=False, server_default=text("now()"))
@@ -1,8 +1,16 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from uuid import UUID
 from datetime import datetime
 from typing import Optional
 
+import app.config as config
+
+
+# общее
+
+class BatchGet(BaseModel):
+    # длина проверяется до разбора UUID: слишком длинный список отклоняется сразу (422)
+    ids: list[UUID] = Field(max_length=config.BATCH_GET_MAX_IDS)
 
 # заказчик  
 class BaseCustomer(BaseModel):
@@ -14,6 +22,9 @@ class CreateCustomer(BaseCustomer):
 class UpdateCustomer(BaseCustomer):
     pass
 
+class PatchCustomer(BaseModel):
+    full_name: Optional[str] = None
+
 class Customer(BaseCustomer):
     uuid: UUID
     date_created: datetime
@@ -22,23 +33,23 @@ class DeleteCustomer(BaseModel):
     message: str
     deleted_customer: Customer
 
-class ListCustomer(BaseModel):
-    items: list[Customer]
-    total: int
-    limit: int
-    offset: int
-
 class FilterCustomer(BaseModel):
     min_total_quantity: Optional[int] = None
     vegetable_type_id: Optional[UUID] = None
     limit: int = 10
     offset: int = 0
+    cursor: Optional[str] = None
 
 class ListCustomer(BaseModel):
     items: list[Customer]
-    total: int
+    total: Optional[int]
     limit: int
     offset: int
+    next_cursor: Optional[str] = None
+
+class BatchCustomer(BaseModel):
+    items: list[Customer]
+    missing: list[UUID]
 # овощи
 
 class BaseVegetable(BaseModel):
@@ -53,6 +64,12 @@ class CreateVegetable(BaseVegetable):
 class UpdateVegetable(BaseVegetable):
     pass
 
+class PatchVegetable(BaseModel):
+    title: Optional[str] = None
+    weight: Optional[int] = None
+    price: Optional[int] = None
+    length: Optional[int] = None
+
 class Vegetable(BaseVegetable):
     uuid: UUID
 
@@ -60,11 +77,16 @@ class DeleteVegetable(BaseModel):
     message: str
     deleted_vegetable: Vegetable
 
+class BatchVegetable(BaseModel):
+    items: list[Vegetable]
+    missing: list[UUID]
+
 class ListVegetable(BaseModel):
     items: list[Vegetable]
-    total: int
+    total: Optional[int]
     limit: int
     offset: int
+    next_cursor: Optional[str] = None
 
 # заказы
 
@@ -79,21 +101,97 @@ class CreateOrder(BaseOrder):
 class UpdateOrder(BaseOrder):
     pass
 
+class PatchOrder(BaseModel):
+    vegetable_id: Optional[UUID] = None
+    customer_id: Optional[UUID] = None
+    quantity: Optional[int] = None
+
 class Order(BaseOrder):
     uuid: UUID
+    created_at: datetime
 
 class FullOrder(BaseOrder):
     uuid: UUID
-    customer: Customer
-    vegetable: Vegetable
+    created_at: datetime
+    # null, если связь не запрошена в expand
+    customer: Optional[Customer] = None
+    vegetable: Optional[Vegetable] = None
 
 class ListOrder(BaseModel):
     items: list[Order]
-    total: int
+    total: Optional[int]
+    limit: int
+    offset: int
+    next_cursor: Optional[str] = None
+
+class ListFullOrder(BaseModel):
+    items: list[FullOrder]
+    total: Optional[int]
     limit: int
     offset: int
+    next_cursor: Optional[str] = None
 
 class DeleteOrder(BaseModel):
     message: str
     deleted_order: Order
 
+class BatchOrder(BaseModel):
+    items: list[Order]
+    missing: list[UUID]
+
+class BulkOrderUpdate(BaseModel):
+    # задаётся ровно одно: новое количество или прибавка к текущему
+    quantity: Optional[int] = None
+    quantity_delta: Optional[int] = None
+
+class BulkOrderChange(BaseModel):
+    affected: int
+    dry_run: bool
+
+class BulkOrderError(BaseModel):
+    index: int
+    detail: str
+
+class BulkOrderResult(BaseModel):
+    inserted: int
+    items: list[UUID]
+    errors: list[BulkOrderError]
+
+# аналитика (из материализованных представлений, refreshed_at - время их обновления)
+
+class CustomerSales(BaseModel):
+    customer_id: UUID
+    full_name: str
+    total_quantity: int
+    total_spend: int
+    order_count: int
+
+class TopCustomers(BaseModel):
+    items: list[CustomerSales]
+    by: str
+    refreshed_at: Optional[datetime]
+
+class VegetableSales(BaseModel):
+    vegetable_id: UUID
+    title: str
+    total_quantity: int
+    order_count: int
+    customer_count: int
+    revenue: int
+
+class ListVegetableSales(BaseModel):
+    items: list[VegetableSales]
+    refreshed_at: Optional[datetime]
+
+class RevenueShare(BaseModel):
+    vegetable_id: UUID
+    title: str
+    revenue: int
+    # доля в общей выручке, 0..1
+    share: float
+
+class RevenueBreakdown(BaseModel):
+    total_revenue: int
+    total_quantity: int
+    items: list[RevenueShare]
+    refreshed_at: Optional[datetime]
@@ -0,0 +1,60 @@
+"""
+Продакшен-запуск: миграции один раз, затем несколько процессов uvicorn
+(по умолчанию на uvloop и httptools, если они установлены).
+
+    python -m app.serve [--workers N] [--host 0.0.0.0] [--port 8000] [--loop auto] [--http auto] [--skip-migrations]
+
+Каждый воркер создаёт свой engine при импорте app.main; размер его пула
+делит DB_CONNECTION_BUDGET на число воркеров (app.db.pool.worker_pool_limits).
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+import uvicorn
+
+import app.config as config
+from app.db.pool import worker_pool_limits
+
+
+def run_migrations():
+    # alembic берёт advisory lock (migrations/env.py), поэтому одновременный
+    # старт нескольких контейнеров применяет каждую ревизию один раз
+    subprocess.run([sys.executable, '-m', 'alembic', 'upgrade', 'head'], check=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Запуск API в несколько процессов')
+    parser.add_argument('--workers', type=int, default=config.WEB_CONCURRENCY, help='по умолчанию WEB_CONCURRENCY или число CPU; при нескольких воркерах кэши процесса выключены')
+    parser.add_argument('--host', default=os.getenv('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('PORT', 8000)))
+    parser.add_argument('--loop', default=config.SERVER_LOOP, choices=('auto', 'uvloop', 'asyncio'))
+    parser.add_argument('--http', default=config.SERVER_HTTP, choices=('auto', 'httptools', 'h11'))
+    parser.add_argument('--skip-migrations', action='store_true', help='не запускать alembic upgrade head')
+    args = parser.parse_args()
+
+    workers = max(args.workers, 1)
+    # воркеры запускаются через spawn и читают app.config заново: бюджет соединений делится на их число
+    os.environ['WEB_CONCURRENCY'] = str(workers)
+    config.WEB_CONCURRENCY = workers
+    try:
+        worker_pool_limits()
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    if not args.skip_migrations:
+        run_migrations()
+
+    uvicorn.run(
+        'app.main:app',
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        loop=args.loop,
+        http=args.http,
+    )
+
+
+if __name__ == '__main__':
+    main()
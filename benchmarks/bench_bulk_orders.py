@@ -0,0 +1,89 @@
+"""
+Сравнение пропускной способности POST /orders/ и POST /orders/bulk.
+
+По умолчанию приложение запускается в этом же процессе через ASGI-транспорт httpx,
+с --base-url запросы идут на уже поднятый сервер.
+
+    python -m benchmarks.bench_bulk_orders --orders 10000 --concurrency 32
+    python -m benchmarks.bench_bulk_orders --base-url http://127.0.0.1:8000 --batch-size 5000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+import app.config as config
+
+
+API = '/api/v1'
+
+
+async def _create_refs(client: httpx.AsyncClient) -> tuple:
+    r = await client.post(f'{API}/customers/', json={'full_name': 'bench-customer'})
+    r.raise_for_status()
+    customer_id = r.json()['uuid']
+    r = await client.post(f'{API}/vegetables/', json={'title': 'bench-veg', 'weight': 1, 'price': 1, 'length': 1})
+    r.raise_for_status()
+    return customer_id, r.json()['uuid']
+
+
+async def bench_single(client: httpx.AsyncClient, payload: list, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _post(item):
+        async with semaphore:
+            r = await client.post(f'{API}/orders/', json=item)
+            r.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(_post(item) for item in payload))
+    return time.perf_counter() - started
+
+
+async def bench_bulk(client: httpx.AsyncClient, payload: list, batch_size: int) -> float:
+    started = time.perf_counter()
+    for start in range(0, len(payload), batch_size):
+        r = await client.post(f'{API}/orders/bulk', json=payload[start:start + batch_size])
+        r.raise_for_status()
+    return time.perf_counter() - started
+
+
+async def run(orders: int, concurrency: int, batch_size: int, base_url: str = None) -> dict:
+    if base_url:
+        transport = None
+    else:
+        from app.main import app
+        transport = httpx.ASGITransport(app=app)
+        base_url = 'http://bench'
+
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, timeout=300.0) as client:
+        customer_id, vegetable_id = await _create_refs(client)
+        payload = [
+            {'customer_id': customer_id, 'vegetable_id': vegetable_id, 'quantity': 1}
+            for _ in range(orders)
+        ]
+        single = await bench_single(client, payload, concurrency)
+        bulk = await bench_bulk(client, payload, batch_size)
+
+    return {
+        'orders': orders,
+        'single': {'seconds': round(single, 3), 'orders_per_second': round(orders / single, 1)},
+        'bulk': {'seconds': round(bulk, 3), 'orders_per_second': round(orders / bulk, 1)},
+        'speedup': round(single / bulk, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='POST /orders/ по одному против POST /orders/bulk')
+    parser.add_argument('--base-url', help='адрес запущенного сервера, без него - ASGI в процессе')
+    parser.add_argument('--orders', type=int, default=10_000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--batch-size', type=int, default=min(10_000, config.BULK_ORDERS_MAX_ITEMS))
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.orders, args.concurrency, args.batch_size, args.base_url)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Процессорное время на сборку и сериализацию страницы ответа без базы и HTTP.
+
+Сравниваются:
+    legacy    - модели по полям, затем response_model в FastAPI (проверка + jsonable_encoder + json.dumps)
+    validated - app.api.serialization: одна проверка from_attributes и to_json в pydantic-core
+    trusted   - то же в режиме TRUSTED_OUTPUT (словари полей схемы без проверки)
+
+    PYTHONPATH=. python benchmarks/bench_serialization.py --items 100 --rounds 2000
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import time
+import uuid
+from types import SimpleNamespace
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+import app.config as config
+from app.api.serialization import build, build_from, to_json
+from app.schemas.schemas import Customer, ListCustomer
+
+
+def _rows(count: int):
+    now = datetime.datetime.now()
+    return [
+        SimpleNamespace(uuid=uuid.uuid4(), full_name=f'customer {index}', date_created=now)
+        for index in range(count)
+    ]
+
+
+def _page(items):
+    return {'items': items, 'total': 10_000, 'limit': len(items), 'offset': 0}
+
+
+async def legacy(rows, field):
+    items = [Customer(uuid=row.uuid, full_name=row.full_name, date_created=row.date_created) for row in rows]
+    content = await serialize_response(field=field, response_content=ListCustomer(**_page(items)), is_coroutine=True)
+    return JSONResponse(content).body
+
+
+async def fast(rows, field):
+    items = [build_from(Customer, row) for row in rows]
+    return to_json(build(ListCustomer, **_page(items)))
+
+
+async def _measure(func, rows, field, rounds: int) -> float:
+    await func(rows, field)
+    started = time.process_time()
+    for _ in range(rounds):
+        await func(rows, field)
+    return (time.process_time() - started) / rounds
+
+
+async def run(items: int, rounds: int) -> dict:
+    rows = _rows(items)
+    field = create_model_field(name='Response_get_customers', type_=ListCustomer, mode='serialization')
+    results = {}
+    for name, func, trusted in (('legacy', legacy, False), ('validated', fast, False), ('trusted', fast, True)):
+        config.TRUSTED_OUTPUT = trusted
+        results[name] = round(await _measure(func, rows, field, rounds) * 1_000_000, 1)
+    config.TRUSTED_OUTPUT = False
+    return {
+        'items': items,
+        'rounds': rounds,
+        'cpu_us_per_request': results,
+        'saved_us_validated': round(results['legacy'] - results['validated'], 1),
+        'saved_us_trusted': round(results['legacy'] - results['trusted'], 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Стоимость сериализации страницы ответа')
+    parser.add_argument('--items', type=int, default=100)
+    parser.add_argument('--rounds', type=int, default=2000)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.items, args.rounds)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Сравнение первичных ключей uuid v4 (gen_random_uuid) и v7 (uuid_generate_v7)
+на вставке в таблицу формы orders: скорость, размер индекса, объём WAL.
+
+Таблицы создаются во временной схеме и удаляются после прогона. Функция
+uuid_generate_v7() появляется миграцией d91b3c7e5a24 (alembic upgrade head).
+
+    python -m benchmarks.bench_uuid_keys --rows 5000000 --batch 10000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import asyncpg
+
+import app.config as config
+from benchmarks.seed import asyncpg_dsn
+
+
+SCHEMA = 'bench_uuid_keys'
+
+KEY_FUNCTIONS = {
+    'v4': 'gen_random_uuid()',
+    'v7': 'uuid_generate_v7()',
+}
+
+
+async def _bench_key(connection, name: str, function: str, rows: int, batch: int) -> dict:
+    table = f'{SCHEMA}.orders_{name}'
+    await connection.execute(
+        f"""
+        CREATE TABLE {table} (
+            uuid uuid PRIMARY KEY DEFAULT {function},
+            vegetable_id uuid NOT NULL,
+            customer_id uuid NOT NULL,
+            quantity integer NOT NULL
+        )
+        """
+    )
+    wal_before = await connection.fetchval('SELECT pg_current_wal_insert_lsn()')
+    started = time.perf_counter()
+    latencies = []
+    inserted = 0
+    while inserted < rows:
+        size = min(batch, rows - inserted)
+        batch_started = time.perf_counter()
+        # ключ берётся из DEFAULT, как при обычной вставке заказа
+        await connection.execute(
+            f"""
+            INSERT INTO {table} (vegetable_id, customer_id, quantity)
+            SELECT gen_random_uuid(), gen_random_uuid(), 1 FROM generate_series(1, $1)
+            """,
+            size,
+        )
+        latencies.append(time.perf_counter() - batch_started)
+        inserted += size
+    elapsed = time.perf_counter() - started
+    wal_bytes = await connection.fetchval('SELECT pg_wal_lsn_diff(pg_current_wal_insert_lsn(), $1)', wal_before)
+
+    last_batch = latencies[-1]
+    latencies.sort()
+    sizes = await connection.fetchrow(
+        f"""
+        SELECT pg_relation_size('{table}_pkey') AS index_bytes,
+               pg_relation_size('{table}') AS table_bytes
+        """
+    )
+    return {
+        'rows': rows,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(rows / elapsed) if elapsed else 0,
+        # последние пачки показывают деградацию, когда индекс перестаёт помещаться в кэш
+        'last_batch_ms': round(last_batch * 1000, 3),
+        'p95_batch_ms': round(latencies[max(0, round(len(latencies) * 0.95) - 1)] * 1000, 3),
+        'index_bytes': sizes['index_bytes'],
+        'table_bytes': sizes['table_bytes'],
+        'wal_bytes': int(wal_bytes),
+    }
+
+
+async def run(rows: int, batch: int, dsn: str = None) -> dict:
+    connection = await asyncpg.connect(dsn or asyncpg_dsn(config.SQLALCHEMY_DATABASE_URI))
+    try:
+        await connection.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+        await connection.execute(f'CREATE SCHEMA {SCHEMA}')
+        results = {}
+        for name, function in KEY_FUNCTIONS.items():
+            try:
+                # оба прогона начинаются сразу после checkpoint, иначе full page writes искажают сравнение WAL
+                await connection.execute('CHECKPOINT')
+            except asyncpg.InsufficientPrivilegeError:
+                pass
+            results[name] = await _bench_key(connection, name, function, rows, batch)
+        return results
+    finally:
+        await connection.execute(f'DROP SCHEMA IF EXISTS {SCHEMA} CASCADE')
+        await connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='uuid v4 против v7: вставка, размер индекса, WAL')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--batch', type=int, default=10_000)
+    parser.add_argument('--dsn', help='строка подключения, по умолчанию из app.config')
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.rows, args.batch, args.dsn)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+"""
+Нагрузочный прогон эндпоинтов app/api/v1 с выводом p50/p95/p99 и RPS в JSON.
+
+По умолчанию приложение запускается в этом же процессе через ASGI-транспорт httpx,
+с --base-url запросы идут на уже поднятый сервер (uvicorn, docker-compose).
+База должна быть заполнена, например через python -m benchmarks.seed.
+
+Параметры GET-запросов меняются от запроса к запросу, а в ASGI-режиме
+объединение одинаковых запросов (COALESCE_REQUESTS) выключено, если не задан
+--coalesce: иначе одновременные одинаковые запросы выполнялись бы один раз
+и задержки были бы занижены. Сервер для --base-url стоит запускать
+с COALESCE_REQUESTS=false; сколько запросов он объединил, видно в meta.coalescing.
+
+    python -m benchmarks.run --requests 2000 --concurrency 50 --output bench.json
+    python -m benchmarks.run --base-url http://127.0.0.1:8000 --only orders.list,orders.get
+    python -m benchmarks.run --writes --only orders.update,orders.delete,orders.bulk
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+from urllib.parse import quote
+
+import httpx
+
+
+API = '/api/v1'
+
+# изменяющие эндпоинты, запускаются только с --writes или явно через --only
+WRITES = (
+    'orders.create', 'orders.update', 'orders.delete', 'orders.bulk',
+    'orders.bulk_update', 'orders.bulk_delete',
+)
+BULK_SIZE = 100
+
+
+def _endpoints(ctx: dict, rng: random.Random):
+    """
+    Имя -> функция, возвращающая (method, url, json) для очередного запроса
+    """
+    customers, vegetables, orders = ctx['customers'], ctx['vegetables'], ctx['orders']
+
+    def new_order():
+        return {'customer_id': rng.choice(customers), 'vegetable_id': rng.choice(vegetables), 'quantity': rng.randint(1, 20)}
+
+    def search_prefix():
+        name = rng.choice(ctx['names'])
+        return quote(name[:rng.randint(1, min(len(name), 5))])
+
+    return {
+        'customers.list': lambda: ('GET', f'{API}/customers/?limit=10&offset={rng.randrange(1000)}', None),
+        'customers.filter_quantity': lambda: (
+            'GET', f'{API}/customers/?min_total_quantity={rng.randint(10, 100)}&limit=10', None
+        ),
+        'customers.filter_vegetable': lambda: (
+            'GET', f'{API}/customers/?vegetable_type_id={rng.choice(vegetables)}&min_total_quantity={rng.randint(1, 20)}&limit=10', None
+        ),
+        'customers.search': lambda: ('GET', f'{API}/customers/?q={search_prefix()}&limit=10', None),
+        'customers.get': lambda: ('GET', f'{API}/customers/{rng.choice(customers)}', None),
+        'vegetables.list': lambda: ('GET', f'{API}/vegetables/?limit={rng.randint(50, 100)}', None),
+        'vegetables.get': lambda: ('GET', f'{API}/vegetables/{rng.choice(vegetables)}', None),
+        'orders.list': lambda: ('GET', f'{API}/orders/?limit=100&skip={rng.randrange(1000)}', None),
+        'orders.list_deep_offset': lambda: ('GET', f'{API}/orders/?limit=100&skip={rng.randint(10000, 11000)}', None),
+        'orders.list_cursor': lambda: (
+            'GET', f'{API}/orders/?limit={rng.randint(50, 100)}&cursor={ctx["orders_cursor"]}', None
+        ),
+        'orders.get': lambda: ('GET', f'{API}/orders/{rng.choice(orders)}', None),
+        'analytics.top_customers': lambda: (
+            'GET', f'{API}/analytics/top-customers?by={rng.choice(("quantity", "spend"))}&limit={rng.randint(5, 50)}', None
+        ),
+        'analytics.vegetables': lambda: (
+            'GET', f'{API}/analytics/vegetables?order_by={rng.choice(("quantity", "revenue"))}&limit={rng.randint(10, 100)}', None
+        ),
+        'analytics.revenue': lambda: ('GET', f'{API}/analytics/revenue?limit={rng.randint(10, 100)}', None),
+        'orders.create': lambda: ('POST', f'{API}/orders/', new_order()),
+        'orders.update': lambda: (
+            'PATCH', f'{API}/orders/{rng.choice(orders)}', {'quantity': rng.randint(1, 20)}
+        ),
+        # удаляются только заказы, созданные прогоном для этого (_prepare_deletes)
+        'orders.delete': lambda: ('DELETE', f'{API}/orders/{ctx["deletable"].pop()}', None),
+        'orders.bulk': lambda: ('POST', f'{API}/orders/bulk', [new_order() for _ in range(BULK_SIZE)]),
+        'orders.bulk_update': lambda: (
+            'PATCH', f'{API}/orders/?customer_id={rng.choice(customers)}', {'quantity': rng.randint(1, 20)}
+        ),
+        # только заказы покупателя, созданные во время прогона
+        'orders.bulk_delete': lambda: (
+            'DELETE', f'{API}/orders/?customer_id={rng.choice(customers)}&created_from={ctx["started_at"]}', None
+        ),
+    }
+
+
+async def _prepare_deletes(client: httpx.AsyncClient, ctx: dict, count: int, rng: random.Random):
+    """
+    Создать count заказов для orders.delete, чтобы не удалять заполненные данные
+    """
+    while len(ctx['deletable']) < count:
+        size = min(count - len(ctx['deletable']), 1000)
+        r = await client.post(f'{API}/orders/bulk', json=[
+            {'customer_id': rng.choice(ctx['customers']), 'vegetable_id': rng.choice(ctx['vegetables']), 'quantity': 1}
+            for _ in range(size)
+        ])
+        r.raise_for_status()
+        ctx['deletable'].extend(r.json()['items'])
+
+
+async def _context(client: httpx.AsyncClient) -> dict:
+    """
+    Идентификаторы существующих строк, на которые будут ссылаться запросы
+    """
+    async def _ids(path):
+        r = await client.get(path)
+        r.raise_for_status()
+        return r.json()
+
+    customers = await _ids(f'{API}/customers/?limit=1000')
+    vegetables = await _ids(f'{API}/vegetables/?limit=1000')
+    orders = await _ids(f'{API}/orders/?limit=1000')
+    if not customers['items'] or not vegetables['items'] or not orders['items']:
+        raise SystemExit('database is empty, run python -m benchmarks.seed first')
+    return {
+        'customers': [item['uuid'] for item in customers['items']],
+        'names': [item['full_name'] for item in customers['items']],
+        'vegetables': [item['uuid'] for item in vegetables['items']],
+        'orders': [item['uuid'] for item in orders['items']],
+        'orders_cursor': orders['next_cursor'] or '',
+        'started_at': datetime.datetime.now(datetime.timezone.utc).isoformat().replace('+00:00', 'Z'),
+        'deletable': [],
+    }
+
+
+def _percentile(sorted_values, percent: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(percent / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def bench_endpoint(client, make_request, requests: int, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            method, url, body = make_request()
+            started = time.perf_counter()
+            try:
+                r = await client.request(method, url, json=body)
+                if r.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'rps': round(requests / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(_percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(_percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(_percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+async def _coalescing(client: httpx.AsyncClient) -> dict:
+    r = await client.get(f'{API}/internal/coalescing')
+    return r.json() if r.status_code == 200 else {}
+
+
+async def run(args) -> dict:
+    if args.base_url:
+        transport = None
+        base_url = args.base_url
+    else:
+        if not args.coalesce:
+            # app.config читается при импорте app.main
+            os.environ['COALESCE_REQUESTS'] = 'false'
+        from app.main import app
+        transport = httpx.ASGITransport(app=app)
+        base_url = 'http://bench'
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, transport=transport, timeout=60.0, limits=limits) as client:
+        ctx = await _context(client)
+        rng = random.Random(args.seed)
+        endpoints = _endpoints(ctx, rng)
+        selected = args.only.split(',') if args.only else [name for name in endpoints if args.writes or name not in WRITES]
+        coalescing_before = await _coalescing(client)
+
+        results = {}
+        for name in selected:
+            warmup = min(args.warmup, args.requests)
+            if name == 'orders.delete':
+                await _prepare_deletes(client, ctx, warmup + args.requests, rng)
+            # прогрев: пул соединений, кэш подготовленных выражений, кэши приложения
+            await bench_endpoint(client, endpoints[name], warmup, args.concurrency)
+            results[name] = await bench_endpoint(client, endpoints[name], args.requests, args.concurrency)
+        coalescing_after = await _coalescing(client)
+
+    return {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'revision': _git_revision(),
+            'python': platform.python_version(),
+            'mode': 'http' if args.base_url else 'asgi',
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            # объединённые запросы за прогон; ненулевые значения занижают задержки GET
+            'coalescing': {
+                key: coalescing_after[key] - coalescing_before.get(key, 0)
+                for key in ('leaders', 'coalesced', 'reused')
+                if key in coalescing_after
+            },
+        },
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный прогон API')
+    parser.add_argument('--base-url', help='адрес запущенного сервера, без него - ASGI в процессе')
+    parser.add_argument('--requests', type=int, default=1000, help='запросов на эндпоинт')
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=100)
+    parser.add_argument('--only', help='список эндпоинтов через запятую')
+    parser.add_argument('--writes', action='store_true', help='включить изменяющие эндпоинты')
+    parser.add_argument('--coalesce', action='store_true', help='не выключать объединение одинаковых GET в ASGI-режиме')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='файл для JSON-результата')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+Генератор синтетических данных для бенчмарков.
+
+Покупатели, овощи и заказы пишутся через COPY пачками, поэтому память
+не зависит от масштаба. После заливки пересчитывается customer_order_stats.
+
+created_at заказов растёт равномерно за последние --months месяцев, и для
+каждого месяца создаётся своя партиция orders, чтобы фильтры по периоду
+отсекали партиции так же, как на боевых данных. Ключи - uuid7 с временем
+от KEY_EPOCH и случайной частью из --seed, поэтому один --seed даёт одни ключи.
+
+    python -m benchmarks.seed --scale 1m
+    python -m benchmarks.seed --orders 250000 --customers 20000 --vegetables 100 --months 12
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import time
+import uuid
+
+import asyncpg
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+import app.config as config
+from app.db.base import AsyncSessionLocal
+from app.db.order_stats import rebuild_order_stats
+from app.db.partitions import add_months, ensure_order_partitions, month_start
+from app.db.uuid7 import uuid7
+
+
+SCALES = {
+    '10k': {'orders': 10_000, 'customers': 1_000, 'vegetables': 50},
+    '1m': {'orders': 1_000_000, 'customers': 100_000, 'vegetables': 200},
+    '10m': {'orders': 10_000_000, 'customers': 1_000_000, 'vegetables': 500},
+}
+
+CHUNK_SIZE = 50_000
+# время в ключах - от фиксированной точки, а не от часов: ключи не зависят от даты запуска
+KEY_EPOCH = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+KEY_EPOCH_NS = int(KEY_EPOCH.timestamp()) * 1_000_000_000
+
+
+def asyncpg_dsn(url: str) -> str:
+    # asyncpg не понимает префикс диалекта SQLAlchemy
+    return url.replace('postgresql+asyncpg://', 'postgresql://', 1)
+
+
+def sqlalchemy_dsn(dsn: str) -> str:
+    # обратное преобразование: --dsn в формате libpq для engine SQLAlchemy
+    for prefix in ('postgresql://', 'postgres://'):
+        if dsn.startswith(prefix):
+            return 'postgresql+asyncpg://' + dsn[len(prefix):]
+    return dsn
+
+
+def _chunks(generator, size: int):
+    chunk = []
+    for record in generator:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+async def _copy(connection, table: str, columns, records):
+    total = 0
+    for chunk in _chunks(records, CHUNK_SIZE):
+        await connection.copy_records_to_table(table, records=chunk, columns=columns)
+        total += len(chunk)
+    return total
+
+
+async def _prepare_partitions(session_factory, months: int) -> datetime.datetime:
+    """
+    Создать партиции на months месяцев назад и вернуть начало самого раннего из них.
+
+    После миграции пустая orders_legacy покрывает всё прошлое до следующего
+    месяца, и все заказы попали бы в неё одну; пустая партиция удаляется.
+    """
+    async with session_factory() as session:
+        legacy_rows = await session.scalar(text(
+            "SELECT CASE WHEN to_regclass('orders_legacy') IS NULL THEN NULL "
+            "ELSE (SELECT count(*) FROM (SELECT 1 FROM orders_legacy LIMIT 1) probe) END"
+        ))
+        if legacy_rows == 0:
+            await session.execute(text('DROP TABLE orders_legacy'))
+        await ensure_order_partitions(session, config.ORDER_PARTITIONS_AHEAD, months_back=months)
+    first = add_months(month_start(datetime.datetime.now(datetime.timezone.utc).date()), -months)
+    return datetime.datetime(first.year, first.month, 1, tzinfo=datetime.timezone.utc)
+
+
+def _created_at(start: datetime.datetime, count: int):
+    # равномерно от start до текущего момента в порядке вставки, как у настоящих заказов
+    step = (datetime.datetime.now(datetime.timezone.utc) - start) / max(count, 1)
+    return (start + step * index for index in range(count))
+
+
+def _uuid7(rng: random.Random, nanoseconds: int) -> uuid.UUID:
+    return uuid7(nanoseconds, rng.getrandbits(62))
+
+
+def _uuids(rng: random.Random, count: int):
+    # ключи версии 7, как у строк, созданных приложением, по миллисекунде на ключ
+    return [_uuid7(rng, KEY_EPOCH_NS + index * 1_000_000) for index in range(count)]
+
+
+def _order_keys(rng: random.Random, count: int):
+    # по микросекунде на заказ: порядок ключей повторяет порядок вставки и created_at
+    return (_uuid7(rng, KEY_EPOCH_NS + index * 1_000) for index in range(count))
+
+
+async def seed(orders: int, customers: int, vegetables: int, seed_value: int = 42, dsn: str = None, months: int = 6) -> dict:
+    rng = random.Random(seed_value)
+    customer_ids = _uuids(rng, customers)
+    vegetable_ids = _uuids(rng, vegetables)
+    now = datetime.datetime.now()
+    timings = {}
+    # с --dsn все шаги, включая партиции и пересчёт агрегатов, идут в эту же базу
+    engine = create_async_engine(sqlalchemy_dsn(dsn)) if dsn else None
+    session_factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False) if engine else AsyncSessionLocal
+    try:
+        created_from = await _prepare_partitions(session_factory, months)
+
+        connection = await asyncpg.connect(dsn or asyncpg_dsn(config.SQLALCHEMY_DATABASE_URI))
+        try:
+            started = time.perf_counter()
+            await _copy(
+                connection, 'customers', ['uuid', 'full_name', 'date_created'],
+                ((customer_id, f'bench customer {index}', now) for index, customer_id in enumerate(customer_ids)),
+            )
+            timings['customers_seconds'] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            await _copy(
+                connection, 'vegetables', ['uuid', 'title', 'weight', 'price', 'length'],
+                (
+                    (vegetable_id, f'bench vegetable {index}', rng.randint(10, 1000), rng.randint(1, 500), rng.randint(1, 50))
+                    for index, vegetable_id in enumerate(vegetable_ids)
+                ),
+            )
+            timings['vegetables_seconds'] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            await _copy(
+                connection, 'orders', ['uuid', 'vegetable_id', 'customer_id', 'quantity', 'created_at'],
+                (
+                    (key, rng.choice(vegetable_ids), rng.choice(customer_ids), rng.randint(1, 20), created_at)
+                    for key, created_at in zip(_order_keys(rng, orders), _created_at(created_from, orders))
+                ),
+            )
+            timings['orders_seconds'] = time.perf_counter() - started
+            await connection.execute('ANALYZE customers; ANALYZE vegetables; ANALYZE orders')
+        finally:
+            await connection.close()
+
+        started = time.perf_counter()
+        async with session_factory() as session:
+            await rebuild_order_stats(session)
+        timings['order_stats_seconds'] = time.perf_counter() - started
+
+        return {
+            'orders': orders,
+            'customers': customers,
+            'vegetables': vegetables,
+            'months': months,
+            **{key: round(value, 3) for key, value in timings.items()},
+        }
+    finally:
+        if engine is not None:
+            await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Заполнить базу синтетическими данными')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='10k')
+    parser.add_argument('--orders', type=int)
+    parser.add_argument('--customers', type=int)
+    parser.add_argument('--vegetables', type=int)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--months', type=int, default=6, help='за сколько месяцев распределить created_at заказов')
+    parser.add_argument('--dsn', help='строка подключения, по умолчанию из app.config')
+    args = parser.parse_args()
+
+    sizes = dict(SCALES[args.scale])
+    for key in sizes:
+        if getattr(args, key) is not None:
+            sizes[key] = getattr(args, key)
+
+    result = asyncio.run(seed(seed_value=args.seed, dsn=args.dsn, months=args.months, **sizes))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""customer_order_stats
+
+Revision ID: a1c3e5f70b02
+Revises: 524237071e55
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c3e5f70b02'
+down_revision = '524237071e55'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('customer_order_stats',
+        sa.Column('customer_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('vegetable_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('total_quantity', sa.BigInteger(), server_default=sa.text('0'), nullable=False),
+        sa.Column('order_count', sa.Integer(), server_default=sa.text('0'), nullable=False),
+        sa.ForeignKeyConstraint(['customer_id'], ['customers.uuid'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['vegetable_id'], ['vegetables.uuid'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('customer_id', 'vegetable_id')
+    )
+    # фильтр по овощу и порогу количества
+    op.create_index(
+        'ix_customer_order_stats_vegetable_total',
+        'customer_order_stats',
+        ['vegetable_id', 'total_quantity'],
+    )
+
+    # первичное заполнение из существующих заказов
+    op.execute(
+        """
+        INSERT INTO customer_order_stats (customer_id, vegetable_id, total_quantity, order_count)
+        SELECT customer_id, vegetable_id, sum(quantity), count(*)
+        FROM orders
+        GROUP BY customer_id, vegetable_id
+        """
+    )
+
+
+def downgrade():
+    op.drop_index('ix_customer_order_stats_vegetable_total', table_name='customer_order_stats')
+    op.drop_table('customer_order_stats')
@@ -0,0 +1,45 @@
+"""trigram search indexes
+
+Revision ID: b7d2f4a61c93
+Revises: a1c3e5f70b02
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2f4a61c93'
+down_revision = 'a1c3e5f70b02'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # CONCURRENTLY не блокирует запись в большие таблицы, но не работает внутри транзакции
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_customers_full_name_trgm',
+            'customers',
+            ['full_name'],
+            postgresql_using='gin',
+            postgresql_ops={'full_name': 'gin_trgm_ops'},
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_vegetables_title_trgm',
+            'vegetables',
+            ['title'],
+            postgresql_using='gin',
+            postgresql_ops={'title': 'gin_trgm_ops'},
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_vegetables_title_trgm', table_name='vegetables', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_customers_full_name_trgm', table_name='customers', postgresql_concurrently=True, if_exists=True)
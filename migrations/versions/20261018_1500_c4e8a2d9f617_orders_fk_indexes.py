@@ -0,0 +1,44 @@
+"""orders foreign key indexes
+
+Revision ID: c4e8a2d9f617
+Revises: b7d2f4a61c93
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a2d9f617'
+down_revision = 'b7d2f4a61c93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        # FK на customers (проверка при удалении покупателя), выборки и массовые
+        # операции по покупателю; INCLUDE позволяет считать агрегаты index-only
+        op.create_index(
+            'ix_orders_customer_vegetable',
+            'orders',
+            ['customer_id', 'vegetable_id'],
+            postgresql_include=['quantity'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        # FK на vegetables и операции по овощу (DELETE/PATCH /orders/?vegetable_id=)
+        op.create_index(
+            'ix_orders_vegetable_customer',
+            'orders',
+            ['vegetable_id', 'customer_id'],
+            postgresql_include=['quantity'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_orders_vegetable_customer', table_name='orders', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_orders_customer_vegetable', table_name='orders', postgresql_concurrently=True, if_exists=True)
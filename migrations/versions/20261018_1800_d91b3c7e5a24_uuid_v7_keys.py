@@ -0,0 +1,53 @@
+"""uuid v7 keys
+
+Revision ID: d91b3c7e5a24
+Revises: c4e8a2d9f617
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd91b3c7e5a24'
+down_revision = 'c4e8a2d9f617'
+branch_labels = None
+depends_on = None
+
+
+TABLES = ('customers', 'vegetables', 'orders')
+
+
+def upgrade():
+    # UUID v7 (RFC 9562): первые 48 бит - миллисекунды Unix-времени поверх случайного v4,
+    # биты 52 и 53 превращают версию 0100 в 0111
+    op.execute(
+        """
+        CREATE OR REPLACE FUNCTION uuid_generate_v7() RETURNS uuid AS $$
+            SELECT encode(
+                set_bit(
+                    set_bit(
+                        overlay(
+                            uuid_send(gen_random_uuid())
+                            PLACING substring(int8send(floor(extract(epoch FROM clock_timestamp()) * 1000)::bigint) FROM 3)
+                            FROM 1 FOR 6
+                        ),
+                        52, 1
+                    ),
+                    53, 1
+                ),
+                'hex'
+            )::uuid
+        $$ LANGUAGE sql VOLATILE PARALLEL SAFE
+        """
+    )
+    # меняется только значение по умолчанию, существующие строки не переписываются
+    for table in TABLES:
+        op.alter_column(table, 'uuid', server_default=sa.text('uuid_generate_v7()'))
+
+
+def downgrade():
+    for table in TABLES:
+        op.alter_column(table, 'uuid', server_default=sa.text('gen_random_uuid()'))
+    op.execute('DROP FUNCTION IF EXISTS uuid_generate_v7()')
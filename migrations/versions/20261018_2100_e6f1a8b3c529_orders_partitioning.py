@@ -0,0 +1,109 @@
+"""orders created_at and monthly range partitioning
+
+Revision ID: e6f1a8b3c529
+Revises: d91b3c7e5a24
+Create Date: 2026-10-18 21:00:00.000000
+
+"""
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6f1a8b3c529'
+down_revision = 'd91b3c7e5a24'
+branch_labels = None
+depends_on = None
+
+# партиции на будущие месяцы, дальше их создаёт python -m app.db.partitions ensure
+MONTHS_AHEAD = 3
+
+
+def _add_months(month: datetime.date, months: int) -> datetime.date:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def _bound(month: datetime.date) -> str:
+    return f"{month.isoformat()} 00:00:00+00"
+
+
+def _create_order_indexes():
+    op.create_index('ix_orders_customer_vegetable', 'orders', ['customer_id', 'vegetable_id'], postgresql_include=['quantity'])
+    op.create_index('ix_orders_vegetable_customer', 'orders', ['vegetable_id', 'customer_id'], postgresql_include=['quantity'])
+
+
+def upgrade():
+    # существующая таблица без копирования данных становится первой партицией:
+    # у всех старых заказов created_at = время миграции (DEFAULT now() без перезаписи таблицы)
+    op.rename_table('orders', 'orders_legacy')
+    op.execute('ALTER TABLE orders_legacy RENAME CONSTRAINT orders_pkey TO orders_legacy_pkey')
+    op.execute('ALTER INDEX ix_orders_customer_vegetable RENAME TO orders_legacy_customer_vegetable')
+    op.execute('ALTER INDEX ix_orders_vegetable_customer RENAME TO orders_legacy_vegetable_customer')
+    op.add_column(
+        'orders_legacy',
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    )
+
+    # ключ партиционирования обязан входить в первичный ключ
+    op.create_table(
+        'orders',
+        sa.Column('uuid', postgresql.UUID(as_uuid=True), server_default=sa.text('uuid_generate_v7()'), nullable=False),
+        sa.Column('vegetable_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('customer_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['customer_id'], ['customers.uuid'], ),
+        sa.ForeignKeyConstraint(['vegetable_id'], ['vegetables.uuid'], ),
+        sa.PrimaryKeyConstraint('uuid', 'created_at'),
+        postgresql_partition_by='RANGE (created_at)',
+    )
+
+    this_month = datetime.datetime.now(datetime.timezone.utc).date().replace(day=1)
+    next_month = _add_months(this_month, 1)
+    # ATTACH один раз читает orders_legacy, чтобы проверить границу и построить индекс (uuid, created_at);
+    # внешние ключи с тем же определением переиспользуются
+    op.execute(
+        f"ALTER TABLE orders ATTACH PARTITION orders_legacy "
+        f"FOR VALUES FROM (MINVALUE) TO ('{_bound(next_month)}')"
+    )
+    # индексы партиции с тем же определением подключаются к индексам родителя без перестроения
+    _create_order_indexes()
+    op.create_index('ix_orders_created_at', 'orders', ['created_at'])
+
+    for offset in range(1, MONTHS_AHEAD + 1):
+        start = _add_months(this_month, offset)
+        op.execute(
+            f"CREATE TABLE orders_y{start.year:04d}m{start.month:02d} PARTITION OF orders "
+            f"FOR VALUES FROM ('{_bound(start)}') TO ('{_bound(_add_months(start, 1))}')"
+        )
+    # страховка, если партиции на очередной месяц не успели создать
+    op.execute('CREATE TABLE orders_default PARTITION OF orders DEFAULT')
+
+
+def downgrade():
+    op.rename_table('orders', 'orders_partitioned')
+    op.execute('ALTER TABLE orders_partitioned RENAME CONSTRAINT orders_pkey TO orders_partitioned_pkey')
+    op.execute('ALTER INDEX ix_orders_customer_vegetable RENAME TO orders_partitioned_customer_vegetable')
+    op.execute('ALTER INDEX ix_orders_vegetable_customer RENAME TO orders_partitioned_vegetable_customer')
+    op.execute('ALTER INDEX ix_orders_created_at RENAME TO orders_partitioned_created_at')
+    op.create_table(
+        'orders',
+        sa.Column('uuid', postgresql.UUID(as_uuid=True), server_default=sa.text('uuid_generate_v7()'), nullable=False),
+        sa.Column('vegetable_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('customer_id', postgresql.UUID(as_uuid=True), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['customer_id'], ['customers.uuid'], ),
+        sa.ForeignKeyConstraint(['vegetable_id'], ['vegetables.uuid'], ),
+        sa.PrimaryKeyConstraint('uuid'),
+    )
+    op.execute(
+        'INSERT INTO orders (uuid, vegetable_id, customer_id, quantity) '
+        'SELECT uuid, vegetable_id, customer_id, quantity FROM orders_partitioned'
+    )
+    # вместе с родителем удаляются все партиции, включая orders_legacy
+    op.drop_table('orders_partitioned')
+    _create_order_indexes()
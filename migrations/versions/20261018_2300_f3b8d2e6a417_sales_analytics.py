@@ -0,0 +1,71 @@
+"""sales analytics materialized views
+
+Revision ID: f3b8d2e6a417
+Revises: e6f1a8b3c529
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8d2e6a417'
+down_revision = 'e6f1a8b3c529'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('analytics_refreshes',
+        sa.Column('view_name', sa.String(), nullable=False),
+        sa.Column('refreshed_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('view_name')
+    )
+
+    # представления строятся по customer_order_stats, который уже поддерживается
+    # инкрементально, поэтому обновление не читает orders;
+    # выручка считается по текущей цене овоща (цена в заказе не хранится)
+    op.execute(
+        """
+        CREATE MATERIALIZED VIEW customer_sales AS
+        SELECT s.customer_id,
+               sum(s.total_quantity)::bigint AS total_quantity,
+               sum(s.total_quantity * v.price)::bigint AS total_spend,
+               sum(s.order_count)::bigint AS order_count
+        FROM customer_order_stats s
+        JOIN vegetables v ON v.uuid = s.vegetable_id
+        WHERE s.order_count > 0
+        GROUP BY s.customer_id
+        """
+    )
+    # уникальный индекс нужен для REFRESH MATERIALIZED VIEW CONCURRENTLY
+    op.create_index('ux_customer_sales_customer', 'customer_sales', ['customer_id'], unique=True)
+    op.create_index('ix_customer_sales_quantity', 'customer_sales', [sa.text('total_quantity DESC'), 'customer_id'])
+    op.create_index('ix_customer_sales_spend', 'customer_sales', [sa.text('total_spend DESC'), 'customer_id'])
+
+    op.execute(
+        """
+        CREATE MATERIALIZED VIEW vegetable_sales AS
+        SELECT s.vegetable_id,
+               sum(s.total_quantity)::bigint AS total_quantity,
+               sum(s.order_count)::bigint AS order_count,
+               count(*) AS customer_count,
+               (sum(s.total_quantity) * v.price)::bigint AS revenue
+        FROM customer_order_stats s
+        JOIN vegetables v ON v.uuid = s.vegetable_id
+        WHERE s.order_count > 0
+        GROUP BY s.vegetable_id, v.price
+        """
+    )
+    op.create_index('ux_vegetable_sales_vegetable', 'vegetable_sales', ['vegetable_id'], unique=True)
+
+    op.execute(
+        "INSERT INTO analytics_refreshes (view_name) VALUES ('customer_sales'), ('vegetable_sales')"
+    )
+
+
+def downgrade():
+    op.execute('DROP MATERIALIZED VIEW IF EXISTS vegetable_sales')
+    op.execute('DROP MATERIALIZED VIEW IF EXISTS customer_sales')
+    op.drop_table('analytics_refreshes')
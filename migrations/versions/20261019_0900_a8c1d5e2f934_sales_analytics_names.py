@@ -0,0 +1,80 @@
+"""names of customers and vegetables in sales analytics views
+
+Revision ID: a8c1d5e2f934
+Revises: f3b8d2e6a417
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8c1d5e2f934'
+down_revision = 'f3b8d2e6a417'
+branch_labels = None
+depends_on = None
+
+
+CUSTOMER_SALES = """
+    CREATE MATERIALIZED VIEW customer_sales AS
+    SELECT s.customer_id,
+           {name}
+           sum(s.total_quantity)::bigint AS total_quantity,
+           sum(s.total_quantity * v.price)::bigint AS total_spend,
+           sum(s.order_count)::bigint AS order_count
+    FROM customer_order_stats s
+    JOIN vegetables v ON v.uuid = s.vegetable_id
+    {join}
+    WHERE s.order_count > 0
+    GROUP BY s.customer_id{group}
+"""
+
+VEGETABLE_SALES = """
+    CREATE MATERIALIZED VIEW vegetable_sales AS
+    SELECT s.vegetable_id,
+           {name}
+           sum(s.total_quantity)::bigint AS total_quantity,
+           sum(s.order_count)::bigint AS order_count,
+           count(*) AS customer_count,
+           (sum(s.total_quantity) * v.price)::bigint AS revenue
+    FROM customer_order_stats s
+    JOIN vegetables v ON v.uuid = s.vegetable_id
+    WHERE s.order_count > 0
+    GROUP BY s.vegetable_id, v.price{group}
+"""
+
+
+def _create_views(with_names: bool):
+    if with_names:
+        op.execute(CUSTOMER_SALES.format(
+            name='c.full_name,', join='JOIN customers c ON c.uuid = s.customer_id', group=', c.full_name'
+        ))
+        op.execute(VEGETABLE_SALES.format(name='v.title,', group=', v.title'))
+    else:
+        op.execute(CUSTOMER_SALES.format(name='', join='', group=''))
+        op.execute(VEGETABLE_SALES.format(name='', group=''))
+    # уникальные индексы нужны для REFRESH MATERIALIZED VIEW CONCURRENTLY
+    op.create_index('ux_customer_sales_customer', 'customer_sales', ['customer_id'], unique=True)
+    op.create_index('ix_customer_sales_quantity', 'customer_sales', [sa.text('total_quantity DESC'), 'customer_id'])
+    op.create_index('ix_customer_sales_spend', 'customer_sales', [sa.text('total_spend DESC'), 'customer_id'])
+    op.create_index('ux_vegetable_sales_vegetable', 'vegetable_sales', ['vegetable_id'], unique=True)
+    # представления пересозданы с текущими данными: старые ETag больше не действительны
+    op.execute(
+        "UPDATE analytics_refreshes SET refreshed_at = now() "
+        "WHERE view_name IN ('customer_sales', 'vegetable_sales')"
+    )
+
+
+def upgrade():
+    # имена берутся в представления при обновлении, а не соединением при чтении:
+    # ответ аналитики целиком соответствует refreshed_at, на котором построен его ETag
+    op.execute('DROP MATERIALIZED VIEW IF EXISTS vegetable_sales')
+    op.execute('DROP MATERIALIZED VIEW IF EXISTS customer_sales')
+    _create_views(with_names=True)
+
+
+def downgrade():
+    op.execute('DROP MATERIALIZED VIEW IF EXISTS vegetable_sales')
+    op.execute('DROP MATERIALIZED VIEW IF EXISTS customer_sales')
+    _create_views(with_names=False)
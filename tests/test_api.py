@@ -1,7 +1,9 @@
 import pytest
 import httpx
 import time
+import json
 from uuid import UUID
+from datetime import datetime, timedelta
 
 BASE_URL = "http://127.0.0.1:8000/api/v1"
 
@@ -12,6 +14,17 @@ def client():
         yield c
 
 
+@pytest.fixture(scope="session")
+def single_process(client):
+    """
+    Тесты счётчиков процесса (/metrics, /internal/cache, /internal/coalescing)
+    имеют смысл только при сервере в один процесс (WEB_CONCURRENCY=1):
+    иначе соседние запросы попадают в разные воркеры
+    """
+    if client.get("/internal/pool").json().get("workers", 1) > 1:
+        pytest.skip("server runs several workers, per-process counters are not comparable")
+
+
 def _create_customer(client, name: str) -> str:
     r = client.post("/customers/", json={"full_name": name})
     r.raise_for_status()
@@ -120,3 +133,644 @@ def test_order_lifecycle(client):
             _delete_customer(client, cust_id)
         except Exception:
             pass
+
+
+def test_vegetables_cursor_pagination(client):
+    created = []
+    try:
+        for i in range(3):
+            payload = {"title": f"pytest-cursor-{i}", "weight": 1, "price": 1, "length": 1}
+            r = client.post("/vegetables/", json=payload)
+            assert r.status_code == 200
+            created.append(r.json()["uuid"])
+
+        seen = []
+        r = client.get("/vegetables/", params={"limit": 2})
+        assert r.status_code == 200
+        page = r.json()
+        seen.extend(item["uuid"] for item in page["items"])
+        while page["next_cursor"]:
+            r = client.get("/vegetables/", params={"limit": 2, "cursor": page["next_cursor"]})
+            assert r.status_code == 200
+            page = r.json()
+            seen.extend(item["uuid"] for item in page["items"])
+
+        assert len(seen) == len(set(seen))
+        assert set(created) <= set(seen)
+
+        r = client.get("/vegetables/", params={"cursor": "not-a-cursor"})
+        assert r.status_code == 400
+    finally:
+        for vid in created:
+            client.delete(f"/vegetables/{vid}")
+
+
+def test_customer_filter_follows_order_writes(client):
+    cust_id = _create_customer(client, f"pytest-stats-{int(time.time()*1000)}")
+    rveg = client.post("/vegetables/", json={"title": "pytest-stats-veg", "weight": 1, "price": 1, "length": 1})
+    assert rveg.status_code == 200
+    veg_id = rveg.json()["uuid"]
+    oid = None
+
+    def _matches(min_qty):
+        r = client.get("/customers/", params={"vegetable_type_id": veg_id, "min_total_quantity": min_qty})
+        assert r.status_code == 200
+        return cust_id in [item["uuid"] for item in r.json()["items"]]
+
+    try:
+        rorder = client.post("/orders/", json={"vegetable_id": veg_id, "customer_id": cust_id, "quantity": 5})
+        assert rorder.status_code == 200
+        oid = rorder.json()["uuid"]
+        assert _matches(5)
+
+        rupd = client.put(f"/orders/{oid}", json={"vegetable_id": veg_id, "customer_id": cust_id, "quantity": 1})
+        assert rupd.status_code == 200
+        assert not _matches(5)
+        assert _matches(1)
+
+        assert client.delete(f"/orders/{oid}").status_code == 200
+        oid = None
+        assert not _matches(1)
+    finally:
+        if oid:
+            client.delete(f"/orders/{oid}")
+        client.delete(f"/vegetables/{veg_id}")
+        _delete_customer(client, cust_id)
+
+
+def test_order_missing_references(client):
+    cust_id = _create_customer(client, f"pytest-fk-{int(time.time()*1000)}")
+    rveg = client.post("/vegetables/", json={"title": "pytest-fk-veg", "weight": 1, "price": 1, "length": 1})
+    assert rveg.status_code == 200
+    veg_id = rveg.json()["uuid"]
+    missing = "00000000-0000-0000-0000-000000000000"
+    oid = None
+    try:
+        r = client.post("/orders/", json={"vegetable_id": veg_id, "customer_id": missing, "quantity": 1})
+        assert r.status_code == 404
+        assert r.json()["detail"] == "Customer not found"
+
+        r = client.post("/orders/", json={"vegetable_id": missing, "customer_id": cust_id, "quantity": 1})
+        assert r.status_code == 404
+        assert r.json()["detail"] == "Vegetable not found"
+
+        r = client.post("/orders/", json={"vegetable_id": veg_id, "customer_id": cust_id, "quantity": 1})
+        assert r.status_code == 200
+        oid = r.json()["uuid"]
+
+        r = client.put(f"/orders/{oid}", json={"vegetable_id": missing, "customer_id": cust_id, "quantity": 1})
+        assert r.status_code == 404
+        assert r.json()["detail"] == "Vegetable not found"
+
+        r = client.put(f"/orders/{missing}", json={"vegetable_id": veg_id, "customer_id": cust_id, "quantity": 1})
+        assert r.status_code == 404
+        assert r.json()["detail"] == "Order not found"
+    finally:
+        if oid:
+            client.delete(f"/orders/{oid}")
+        client.delete(f"/vegetables/{veg_id}")
+        _delete_customer(client, cust_id)
+
+
+def test_bulk_orders(client):
+    cust_id = _create_customer(client, f"pytest-bulk-{int(time.time()*1000)}")
+    rveg = client.post("/vegetables/", json={"title": "pytest-bulk-veg", "weight": 1, "price": 1, "length": 1})
+    assert rveg.status_code == 200
+    veg_id = rveg.json()["uuid"]
+    missing = "00000000-0000-0000-0000-000000000000"
+    created = []
+    try:
+        good = {"vegetable_id": veg_id, "customer_id": cust_id, "quantity": 2}
+        bad = {"vegetable_id": missing, "customer_id": cust_id, "quantity": 1}
+
+        r = client.post("/orders/bulk", json=[good, bad])
+        assert r.status_code == 422
+
+        r = client.post("/orders/bulk", params={"mode": "partial"}, json=[good, bad, {"quantity": 1}])
+        assert r.status_code == 200
+        data = r.json()
+        created.extend(data["items"])
+        assert data["inserted"] == 1
+        assert [e["index"] for e in data["errors"]] == [1, 2]
+        assert data["errors"][0]["detail"] == "Vegetable not found"
+
+        ndjson = "\n".join(json.dumps(good) for _ in range(3))
+        r = client.post("/orders/bulk", content=ndjson, headers={"content-type": "application/x-ndjson"})
+        assert r.status_code == 200
+        created.extend(r.json()["items"])
+        assert r.json()["inserted"] == 3
+
+        for oid in created:
+            assert client.get(f"/orders/{oid}").status_code == 200
+    finally:
+        for oid in created:
+            client.delete(f"/orders/{oid}")
+        client.delete(f"/vegetables/{veg_id}")
+        _delete_customer(client, cust_id)
+
+
+def test_export_vegetables(client):
+    r = client.post("/vegetables/", json={"title": "pytest-export", "weight": 1, "price": 2, "length": 3})
+    assert r.status_code == 200
+    vid = r.json()["uuid"]
+    try:
+        r = client.get("/vegetables/export", params={"format": "ndjson"})
+        assert r.status_code == 200
+        rows = [json.loads(line) for line in r.text.splitlines()]
+        assert vid in [row["uuid"] for row in rows]
+
+        r = client.get("/vegetables/export", params={"format": "csv"})
+        assert r.status_code == 200
+        lines = r.text.splitlines()
+        assert lines[0] == "uuid,title,weight,price,length"
+        assert any(line.startswith(vid) for line in lines[1:])
+    finally:
+        client.delete(f"/vegetables/{vid}")
+
+
+def test_vegetable_cache_invalidation(client, single_process):
+    r = client.post("/vegetables/", json={"title": "pytest-cache", "weight": 1, "price": 1, "length": 1})
+    assert r.status_code == 200
+    vid = r.json()["uuid"]
+    try:
+        assert client.get(f"/vegetables/{vid}").status_code == 200
+        hits = client.get("/internal/cache").json()["vegetables"]["hits"]
+        assert client.get(f"/vegetables/{vid}").json()["title"] == "pytest-cache"
+        assert client.get("/internal/cache").json()["vegetables"]["hits"] >= hits + 1
+
+        upd = {"title": "pytest-cache-upd", "weight": 1, "price": 1, "length": 1}
+        assert client.put(f"/vegetables/{vid}", json=upd).status_code == 200
+        assert client.get(f"/vegetables/{vid}").json()["title"] == "pytest-cache-upd"
+    finally:
+        client.delete(f"/vegetables/{vid}")
+
+
+def test_conditional_get(client):
+    cust_id = _create_customer(client, f"pytest-etag-{int(time.time()*1000)}")
+    try:
+        r = client.get(f"/customers/{cust_id}")
+        assert r.status_code == 200
+        etag = r.headers["etag"]
+
+        r = client.get(f"/customers/{cust_id}", headers={"If-None-Match": etag})
+        assert r.status_code == 304
+        assert r.content == b""
+
+        assert client.put(f"/customers/{cust_id}", json={"full_name": "pytest-etag-upd"}).status_code == 200
+        r = client.get(f"/customers/{cust_id}", headers={"If-None-Match": etag})
+        assert r.status_code == 200
+        assert r.headers["etag"] != etag
+
+        r = client.get("/vegetables/")
+        assert r.status_code == 200
+        r2 = client.get("/vegetables/", headers={"If-None-Match": r.headers["etag"]})
+        assert r2.status_code == 304
+    finally:
+        _delete_customer(client, cust_id)
+
+
+def test_pool_stats(client):
+    r = client.get("/internal/pool")
+    assert r.status_code == 200
+    data = r.json()
+    for key in ("size", "checked_out", "idle", "overflow", "wait_seconds", "workers"):
+        assert key in data
+    assert data["wait_seconds"]["count"] >= 0
+
+
+def test_metrics_endpoint(client, single_process):
+    assert client.get("/customers/").status_code == 200
+    r = httpx.get(BASE_URL.rsplit("/api/v1", 1)[0] + "/metrics", timeout=10.0)
+    assert r.status_code == 200
+    assert 'route="/api/v1/customers/"' in r.text
+    assert 'db_statements_total{method="GET",route="/api/v1/customers/"}' in r.text
+
+
+def test_list_total_counts(client):
+    created = []
+    try:
+        for i in range(2):
+            r = client.post("/vegetables/", json={"title": f"pytest-count-{i}", "weight": 1, "price": 1, "length": 1})
+            assert r.status_code == 200
+            created.append(r.json()["uuid"])
+
+        r = client.get("/vegetables/", params={"limit": 1})
+        assert r.status_code == 200
+        assert len(r.json()["items"]) == 1
+        assert r.json()["total"] >= 2
+
+        r = client.get("/vegetables/", params={"limit": 1, "count": "none"})
+        assert r.json()["total"] is None
+
+        r = client.get("/orders/", params={"limit": 1, "count": "estimated"})
+        assert r.status_code == 200
+        assert isinstance(r.json()["total"], int)
+    finally:
+        for vid in created:
+            client.delete(f"/vegetables/{vid}")
+
+
+def _statements_for(route: str, method: str = "GET") -> int:
+    r = httpx.get(BASE_URL.rsplit("/api/v1", 1)[0] + "/metrics", timeout=10.0)
+    for line in r.text.splitlines():
+        if line.startswith(f'db_statements_total{{method="{method}",route="{route}"}}'):
+            return int(float(line.rsplit(" ", 1)[1]))
+    return 0
+
+
+def test_orders_expand_constant_queries(client, single_process):
+    cust_id = _create_customer(client, f"pytest-expand-{int(time.time()*1000)}")
+    r = client.post("/vegetables/", json={"title": "pytest-expand", "weight": 1, "price": 1, "length": 1})
+    assert r.status_code == 200
+    veg_id = r.json()["uuid"]
+    created = []
+    try:
+        for i in range(5):
+            r = client.post("/orders/", json={"customer_id": cust_id, "vegetable_id": veg_id, "quantity": i + 1})
+            assert r.status_code == 200
+            created.append(r.json()["uuid"])
+
+        r = client.get(f"/orders/{created[0]}", params={"expand": "customer,vegetable"})
+        assert r.status_code == 200
+        data = r.json()
+        assert data["customer"]["uuid"] == cust_id
+        assert data["vegetable"]["title"] == "pytest-expand"
+
+        r = client.get(f"/orders/{created[0]}", params={"expand": "customer"})
+        assert r.json()["vegetable"] is None
+
+        assert client.get("/orders/", params={"expand": "nope"}).status_code == 400
+
+        route = "/api/v1/orders/"
+        params = {"expand": "customer,vegetable", "count": "none"}
+        assert client.get("/orders/", params={**params, "limit": 1}).status_code == 200
+
+        statements = []
+        for limit in (1, 5, 200):
+            before = _statements_for(route)
+            r = client.get("/orders/", params={**params, "limit": limit})
+            assert r.status_code == 200
+            assert all(item["customer"] and item["vegetable"] for item in r.json()["items"])
+            statements.append(_statements_for(route) - before)
+        assert len(set(statements)) == 1
+    finally:
+        for oid in created:
+            client.delete(f"/orders/{oid}")
+        client.delete(f"/vegetables/{veg_id}")
+        _delete_customer(client, cust_id)
+
+
+def test_sparse_fields(client):
+    r = client.post("/vegetables/", json={"title": "pytest-fields", "weight": 3, "price": 4, "length": 5})
+    assert r.status_code == 200
+    vid = r.json()["uuid"]
+    try:
+        r = client.get(f"/vegetables/{vid}", params={"fields": "title,uuid"})
+        assert r.status_code == 200
+        assert r.json() == {"uuid": vid, "title": "pytest-fields"}
+
+        r = client.get("/vegetables/", params={"fields": "title"})
+        assert r.status_code == 200
+        data = r.json()
+        assert {"items", "total", "limit", "offset", "next_cursor"} <= data.keys()
+        assert all(item.keys() == {"title"} for item in data["items"])
+
+        r = client.get("/customers/", params={"fields": "full_name", "limit": 2})
+        assert r.status_code == 200
+        assert all(item.keys() == {"full_name"} for item in r.json()["items"])
+
+        r = client.get("/orders/", params={"fields": "uuid,quantity", "limit": 2})
+        assert r.status_code == 200
+        assert all(item.keys() == {"uuid", "quantity"} for item in r.json()["items"])
+
+        assert client.get("/vegetables/", params={"fields": "title,secret"}).status_code == 400
+        assert client.get(f"/vegetables/{vid}", params={"fields": "nope"}).status_code == 400
+        assert client.get("/orders/", params={"fields": "uuid", "expand": "customer"}).status_code == 400
+    finally:
+        client.delete(f"/vegetables/{vid}")
+
+
+def test_batch_get(client):
+    first = _create_customer(client, "pytest-batch-1")
+    second = _create_customer(client, "pytest-batch-2")
+    missing = "00000000-0000-4000-8000-000000000000"
+    try:
+        r = client.post("/customers/batch-get", json={"ids": [second, missing, first, second]})
+        assert r.status_code == 200
+        data = r.json()
+        assert [item["uuid"] for item in data["items"]] == [second, first]
+        assert data["missing"] == [missing]
+
+        r = client.post("/customers/batch-get", params={"fields": "full_name"}, json={"ids": [first]})
+        assert r.json()["items"] == [{"full_name": "pytest-batch-1"}]
+
+        r = client.post("/orders/batch-get", json={"ids": [missing]})
+        assert r.status_code == 200
+        assert r.json() == {"items": [], "missing": [missing]}
+
+        r = client.post("/vegetables/batch-get", json={"ids": []})
+        assert r.json() == {"items": [], "missing": []}
+
+        assert client.post("/customers/batch-get", json={"ids": ["not-a-uuid"]}).status_code == 422
+        # лимит проверяется схемой до разбора UUID
+        r = client.post("/customers/batch-get", json={"ids": ["not-a-uuid"] * 100_000})
+        assert r.status_code == 422
+        assert r.json()["detail"][0]["type"] == "too_long"
+    finally:
+        _delete_customer(client, first)
+        _delete_customer(client, second)
+
+
+def test_patch_and_delete_returning(client):
+    cust_id = _create_customer(client, "pytest-patch")
+    r = client.post("/vegetables/", json={"title": "pytest-patch", "weight": 1, "price": 2, "length": 3})
+    assert r.status_code == 200
+    veg_id = r.json()["uuid"]
+    order_id = None
+    try:
+        r = client.patch(f"/vegetables/{veg_id}", json={"price": 7})
+        assert r.status_code == 200
+        assert r.json() == {"uuid": veg_id, "title": "pytest-patch", "weight": 1, "price": 7, "length": 3}
+        assert client.get(f"/vegetables/{veg_id}").json()["price"] == 7
+
+        assert client.patch(f"/vegetables/{veg_id}", json={}).status_code == 400
+        assert client.patch(f"/vegetables/{veg_id}", json={"title": None}).status_code == 422
+        assert client.patch("/customers/00000000-0000-4000-8000-000000000000", json={"full_name": "x"}).status_code == 404
+
+        r = client.patch(f"/customers/{cust_id}", json={"full_name": "pytest-patch-upd"})
+        assert r.status_code == 200
+        assert r.json()["full_name"] == "pytest-patch-upd"
+
+        r = client.post("/orders/", json={"customer_id": cust_id, "vegetable_id": veg_id, "quantity": 4})
+        assert r.status_code == 200
+        order_id = r.json()["uuid"]
+
+        r = client.patch(f"/orders/{order_id}", json={"quantity": 9})
+        assert r.status_code == 200
+        assert r.json()["quantity"] == 9
+        r = client.get("/customers/", params={"vegetable_type_id": veg_id, "min_total_quantity": 9})
+        assert cust_id in [item["uuid"] for item in r.json()["items"]]
+
+        assert client.delete(f"/customers/{cust_id}").status_code == 409
+
+        r = client.delete(f"/orders/{order_id}")
+        assert r.status_code == 200
+        assert r.json()["deleted_order"]["quantity"] == 9
+        order_id = None
+        assert client.delete(f"/orders/{r.json()['deleted_order']['uuid']}").status_code == 404
+        r = client.get("/customers/", params={"vegetable_type_id": veg_id})
+        assert cust_id not in [item["uuid"] for item in r.json()["items"]]
+
+        r = client.delete(f"/customers/{cust_id}")
+        assert r.status_code == 200
+        assert r.json()["deleted_customer"]["full_name"] == "pytest-patch-upd"
+    finally:
+        if order_id:
+            client.delete(f"/orders/{order_id}")
+        _delete_customer(client, cust_id)
+        client.delete(f"/vegetables/{veg_id}")
+
+
+def test_orders_bulk_delete_and_update(client):
+    cust_id = _create_customer(client, "pytest-bulk-filter")
+    r = client.post("/vegetables/", json={"title": "pytest-bulk-filter", "weight": 1, "price": 1, "length": 1})
+    assert r.status_code == 200
+    veg_id = r.json()["uuid"]
+    try:
+        for quantity in (1, 2, 3):
+            r = client.post("/orders/", json={"customer_id": cust_id, "vegetable_id": veg_id, "quantity": quantity})
+            assert r.status_code == 200
+
+        assert client.delete("/orders/").status_code == 400
+
+        r = client.patch("/orders/", params={"vegetable_id": veg_id}, json={"quantity_delta": 10})
+        assert r.status_code == 200
+        assert r.json() == {"affected": 3, "dry_run": False}
+        r = client.get("/customers/", params={"vegetable_type_id": veg_id, "min_total_quantity": 36})
+        assert cust_id in [item["uuid"] for item in r.json()["items"]]
+
+        assert client.patch("/orders/", params={"vegetable_id": veg_id}, json={}).status_code == 400
+
+        r = client.delete("/orders/", params={"vegetable_id": veg_id, "customer_id": cust_id, "dry_run": True})
+        assert r.json() == {"affected": 3, "dry_run": True}
+
+        r = client.delete("/orders/", params={"vegetable_id": veg_id})
+        assert r.json() == {"affected": 3, "dry_run": False}
+        r = client.delete("/orders/", params={"vegetable_id": veg_id, "dry_run": True})
+        assert r.json()["affected"] == 0
+        r = client.get("/customers/", params={"vegetable_type_id": veg_id})
+        assert cust_id not in [item["uuid"] for item in r.json()["items"]]
+    finally:
+        client.delete("/orders/", params={"vegetable_id": veg_id})
+        client.delete(f"/vegetables/{veg_id}")
+        _delete_customer(client, cust_id)
+
+
+def test_search(client):
+    suffix = int(time.time() * 1000)
+    names = [f"Zyxwadlo {suffix}", f"Zyxwadla {suffix}", "pytest unrelated customer"]
+    created = [_create_customer(client, name) for name in names]
+    try:
+        r = client.get("/customers/", params={"q": f"Zyxwadlo {suffix}", "limit": 5})
+        assert r.status_code == 200
+        found = [item["full_name"] for item in r.json()["items"]]
+        assert found[0] == names[0]
+        assert names[2] not in found
+
+        r = client.get("/customers/", params={"q": "Zyxwad", "limit": 50})
+        found = [item["full_name"] for item in r.json()["items"]]
+        assert names[0] in found and names[1] in found
+        assert r.json()["next_cursor"] is None
+
+        r = client.get("/customers/", params={"q": "%", "limit": 5})
+        assert r.status_code == 200
+
+        r = client.get("/vegetables/", params={"q": "pytest"})
+        assert r.status_code == 200
+
+        assert client.get("/customers/", params={"q": "x", "cursor": "abc"}).status_code == 400
+        assert client.get("/customers/", params={"q": ""}).status_code == 422
+    finally:
+        for uid in created:
+            _delete_customer(client, uid)
+
+
+def test_time_ordered_keys(client):
+    first = _create_customer(client, "pytest-uuid7-1")
+    # вставки в разные миллисекунды: внутри одной порядок ключей не гарантирован
+    time.sleep(0.005)
+    second = _create_customer(client, "pytest-uuid7-2")
+    try:
+        assert UUID(first).version == 7
+        assert UUID(second).version == 7
+        # сравнивается только 48-битная метка времени в миллисекундах
+        assert UUID(first).int >> 80 < UUID(second).int >> 80
+    finally:
+        _delete_customer(client, first)
+        _delete_customer(client, second)
+
+
+def test_order_created_at_filters(client):
+    cust_id = _create_customer(client, "pytest-created-at")
+    r = client.post("/vegetables/", json={"title": "pytest-created-at", "weight": 1, "price": 1, "length": 1})
+    assert r.status_code == 200
+    veg_id = r.json()["uuid"]
+    try:
+        r = client.post("/orders/", json={"customer_id": cust_id, "vegetable_id": veg_id, "quantity": 5})
+        assert r.status_code == 200
+        order = r.json()
+        created_at = datetime.fromisoformat(order["created_at"])
+        assert created_at.tzinfo is not None
+        assert client.get(f"/orders/{order['uuid']}").json()["created_at"] == order["created_at"]
+
+        before = (created_at - timedelta(minutes=1)).isoformat()
+        after = (created_at + timedelta(minutes=1)).isoformat()
+        r = client.get("/orders/", params={"created_from": before, "created_to": after, "limit": 1000})
+        assert r.status_code == 200
+        assert order["uuid"] in [item["uuid"] for item in r.json()["items"]]
+        r = client.get("/orders/", params={"created_from": after, "count": "none"})
+        assert order["uuid"] not in [item["uuid"] for item in r.json()["items"]]
+
+        r = client.get("/customers/", params={"created_from": before, "vegetable_type_id": veg_id, "min_total_quantity": 5})
+        assert cust_id in [item["uuid"] for item in r.json()["items"]]
+        r = client.get("/customers/", params={"created_to": before, "vegetable_type_id": veg_id})
+        assert cust_id not in [item["uuid"] for item in r.json()["items"]]
+
+        r = client.delete("/orders/", params={"created_from": after, "vegetable_id": veg_id, "dry_run": True})
+        assert r.json() == {"affected": 0, "dry_run": True}
+    finally:
+        client.delete("/orders/", params={"vegetable_id": veg_id})
+        client.delete(f"/vegetables/{veg_id}")
+        _delete_customer(client, cust_id)
+
+
+def test_analytics(client):
+    cust_id = _create_customer(client, "pytest-analytics")
+    r = client.post("/vegetables/", json={"title": "pytest-analytics", "weight": 1, "price": 10000000, "length": 1})
+    assert r.status_code == 200
+    veg_id = r.json()["uuid"]
+    try:
+        r = client.post("/orders/", json={"customer_id": cust_id, "vegetable_id": veg_id, "quantity": 1000})
+        assert r.status_code == 200
+        r = client.post("/internal/analytics/refresh")
+        assert r.status_code == 200
+
+        r = client.get("/analytics/top-customers", params={"by": "spend", "limit": 1})
+        assert r.status_code == 200
+        data = r.json()
+        assert data["by"] == "spend" and data["refreshed_at"] is not None
+        assert data["items"][0]["customer_id"] == cust_id
+        assert data["items"][0]["total_spend"] >= 1000 * 10000000
+
+        r = client.get("/analytics/vegetables", params={"order_by": "revenue"})
+        item = next(item for item in r.json()["items"] if item["vegetable_id"] == veg_id)
+        assert item == {
+            "vegetable_id": veg_id,
+            "title": "pytest-analytics",
+            "total_quantity": 1000,
+            "order_count": 1,
+            "customer_count": 1,
+            "revenue": 1000 * 10000000,
+        }
+
+        # имена берутся из представлений: до обновления ответ и ETag не меняются,
+        # после обновления меняются вместе
+        etag = r.headers["etag"]
+        assert client.patch(f"/vegetables/{veg_id}", json={"title": "pytest-analytics-renamed"}).status_code == 200
+        r = client.get("/analytics/vegetables", params={"order_by": "revenue"})
+        assert r.headers["etag"] == etag
+        assert next(item for item in r.json()["items"] if item["vegetable_id"] == veg_id)["title"] == "pytest-analytics"
+        assert client.post("/internal/analytics/refresh").status_code == 200
+        r = client.get("/analytics/vegetables", params={"order_by": "revenue"}, headers={"If-None-Match": etag})
+        assert r.status_code == 200
+        assert next(item for item in r.json()["items"] if item["vegetable_id"] == veg_id)["title"] == "pytest-analytics-renamed"
+
+        r = client.get("/analytics/revenue")
+        data = r.json()
+        assert data["total_revenue"] >= 1000 * 10000000
+        assert data["items"][0]["vegetable_id"] == veg_id
+        assert 0 < data["items"][0]["share"] <= 1
+
+        etag = r.headers["etag"]
+        assert client.get("/analytics/revenue", headers={"If-None-Match": etag}).status_code == 304
+        assert client.get("/analytics/top-customers", params={"limit": 0}).status_code == 422
+    finally:
+        client.delete("/orders/", params={"vegetable_id": veg_id})
+        client.delete(f"/vegetables/{veg_id}")
+        _delete_customer(client, cust_id)
+        client.post("/internal/analytics/refresh")
+
+
+def test_coalesced_identical_gets(client, single_process):
+    from concurrent.futures import ThreadPoolExecutor
+
+    before = client.get("/internal/coalescing").json()
+    # уникальный лишний параметр: ключ не пересекается с другими тестами
+    params = {"min_total_quantity": 1, "limit": 5, "pytest": time.time()}
+
+    def _get(_):
+        with httpx.Client(base_url=BASE_URL, timeout=10.0) as c:
+            return c.get("/customers/", params=params)
+
+    with ThreadPoolExecutor(max_workers=20) as pool:
+        responses = list(pool.map(_get, range(20)))
+    assert all(r.status_code == 200 for r in responses)
+    assert len({r.content for r in responses}) == 1
+
+    after = client.get("/internal/coalescing").json()
+    outcomes = ("leaders", "coalesced", "reused", "fallbacks")
+    assert sum(after[name] - before[name] for name in outcomes) == 20
+    assert after["leaders"] - before["leaders"] >= 1
+    shared = [r for r in responses if "x-coalesced" in r.headers]
+    assert len(shared) == (after["coalesced"] - before["coalesced"]) + (after["reused"] - before["reused"])
+
+    if after["reuse_seconds"] > 0:
+        # повтор сразу после завершения детерминированно получает сохранённый ответ
+        r = client.get("/customers/", params=params)
+        assert r.headers.get("x-coalesced") == "reused"
+
+
+def test_coalescing_shares_leader_response():
+    """
+    Без сервера: ведущий запрос держится, пока не присоединятся остальные,
+    поэтому пересечение гарантировано и ответ обязан разделиться
+    """
+    import asyncio
+
+    from app.coalescing import SingleFlight
+    from app.middleware import CoalescingMiddleware
+
+    flights = SingleFlight(reuse_seconds=0, max_body_bytes=1024 * 1024)
+    release = asyncio.Event()
+    calls = []
+
+    async def slow_endpoint(scope, receive, send):
+        calls.append(scope["path"])
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b'{"ok":true}'})
+
+    async def run():
+        transport = httpx.ASGITransport(app=CoalescingMiddleware(slow_endpoint, flights))
+        async with httpx.AsyncClient(transport=transport, base_url="http://coalescing") as c:
+            requests = [asyncio.ensure_future(c.get("/api/v1/customers/", params={"limit": 5})) for _ in range(20)]
+            while not calls:
+                await asyncio.sleep(0.01)
+            # остальные запросы успевают дойти до ожидания ведущего
+            await asyncio.sleep(0.1)
+            release.set()
+            return await asyncio.gather(*requests)
+
+    responses = asyncio.run(run())
+    assert all(r.status_code == 200 and r.json() == {"ok": True} for r in responses)
+    assert len(calls) == 1
+    assert flights.leaders == 1 and flights.coalesced == 19
+    assert sum(r.headers.get("x-coalesced") == "coalesced" for r in responses) == 19
+
+
+def test_health_endpoints():
+    root = BASE_URL.rsplit("/api/v1", 1)[0]
+    r = httpx.get(f"{root}/healthz", timeout=10.0)
+    assert r.status_code == 200 and r.json() == {"status": "ok"}
+    r = httpx.get(f"{root}/readyz", timeout=10.0)
+    assert r.status_code == 200 and r.json() == {"status": "ready"}
@@ -0,0 +1,221 @@
+"""
+Регрессия планов запросов: запросы роутеров не должны читать orders
+последовательным сканированием.
+
+Приложение поднимается в процессе (ASGI-транспорт httpx), все SQL-выражения,
+которые оно отправляет в базу, перехватываются и затем прогоняются через
+EXPLAIN с enable_seqscan = off: Seq Scan в таком плане значит, что подходящего
+индекса нет вовсе, а не что планировщик выбрал его на маленькой таблице.
+
+Нужна база с применёнными миграциями и данными, например:
+    alembic upgrade head && python -m benchmarks.seed --scale 10k
+"""
+import asyncio
+import datetime
+import json
+import re
+from uuid import UUID
+
+import httpx
+import pytest
+from sqlalchemy import event
+
+from app.db.base import engine
+from app.main import app
+
+
+API = "/api/v1"
+
+# сценарии, для которых полный проход по orders - ожидаемое поведение
+FULL_SCAN_ALLOWED = {"orders.export"}
+
+ORDERS_TABLE = re.compile(r"\borders\b")
+
+# то, что выполняют триггеры внешних ключей при удалении покупателя и овоща
+# (для партиционированной orders - без ONLY, по всем партициям)
+FOREIGN_KEY_CHECKS = {
+    "fk.customer": "SELECT 1 FROM orders x WHERE customer_id = $1::uuid FOR KEY SHARE OF x",
+    "fk.vegetable": "SELECT 1 FROM orders x WHERE vegetable_id = $1::uuid FOR KEY SHARE OF x",
+}
+
+# сценарии с фильтром по created_at, в них Postgres должен отсекать партиции
+PERIOD_SCENARIOS = {"customers.period", "orders.period", "orders.period_expand", "orders.bulk_delete_period"}
+
+# период - месяц через два от текущего: читаться должна только его партиция,
+# а orders_legacy, orders_default и партиции других месяцев отсекаться
+FUTURE_MONTH = (datetime.date.today().replace(day=1) + datetime.timedelta(days=62)).replace(day=1)
+FUTURE_MONTH_END = (FUTURE_MONTH + datetime.timedelta(days=32)).replace(day=1)
+PERIOD = f"created_from={FUTURE_MONTH.isoformat()}&created_to={FUTURE_MONTH_END.isoformat()}"
+
+MONTHLY_PARTITION = re.compile(r"^orders_y(\d{4})m(\d{2})$")
+
+
+def _scenarios(ids: dict):
+    customer, vegetable, order = ids["customer"], ids["vegetable"], ids["order"]
+    return [
+        ("customers.list", "GET", f"{API}/customers/?limit=50", None),
+        ("customers.filter", "GET", f"{API}/customers/?vegetable_type_id={vegetable}&min_total_quantity=1", None),
+        ("customers.search", "GET", f"{API}/customers/?q=bench", None),
+        ("customers.get", "GET", f"{API}/customers/{customer}", None),
+        ("customers.batch_get", "POST", f"{API}/customers/batch-get", {"ids": [customer]}),
+        ("vegetables.list", "GET", f"{API}/vegetables/?limit=50", None),
+        ("vegetables.get", "GET", f"{API}/vegetables/{vegetable}", None),
+        ("orders.list", "GET", f"{API}/orders/?limit=50", None),
+        ("orders.list_count", "GET", f"{API}/orders/?limit=50&count=estimated", None),
+        ("orders.list_expand", "GET", f"{API}/orders/?limit=50&expand=customer,vegetable&count=none", None),
+        ("orders.list_fields", "GET", f"{API}/orders/?limit=50&fields=uuid,quantity&count=none", None),
+        ("orders.get", "GET", f"{API}/orders/{order}", None),
+        ("orders.get_expand", "GET", f"{API}/orders/{order}?expand=customer,vegetable", None),
+        ("orders.batch_get", "POST", f"{API}/orders/batch-get", {"ids": [order]}),
+        ("orders.bulk_delete_dry_run", "DELETE", f"{API}/orders/?vegetable_id={vegetable}&dry_run=true", None),
+        ("orders.bulk_update_dry_run", "PATCH", f"{API}/orders/?customer_id={customer}&dry_run=true", {"quantity_delta": 1}),
+        ("orders.export", "GET", f"{API}/orders/export", None),
+        ("customers.period", "GET", f"{API}/customers/?{PERIOD}&min_total_quantity=1", None),
+        ("orders.period", "GET", f"{API}/orders/?{PERIOD}&limit=50", None),
+        ("orders.period_expand", "GET", f"{API}/orders/?{PERIOD}&expand=customer&count=none", None),
+        ("orders.bulk_delete_period", "DELETE", f"{API}/orders/?{PERIOD}&dry_run=true", None),
+        ("analytics.top_customers", "GET", f"{API}/analytics/top-customers?by=spend", None),
+        ("analytics.vegetables", "GET", f"{API}/analytics/vegetables", None),
+        ("analytics.revenue", "GET", f"{API}/analytics/revenue", None),
+    ]
+
+
+def _write_scenarios(ids: dict):
+    """
+    Изменяющие запросы на отдельных строках, которые в конце удаляются
+    """
+    customer, vegetable = ids["customer"], ids["vegetable"]
+    return [
+        ("orders.create", "POST", f"{API}/orders/", {"customer_id": customer, "vegetable_id": vegetable, "quantity": 1}),
+        ("orders.update", "PUT", f"{API}/orders/{{created}}", {"customer_id": customer, "vegetable_id": vegetable, "quantity": 2}),
+        ("orders.patch", "PATCH", f"{API}/orders/{{created}}", {"quantity": 3}),
+        ("orders.delete", "DELETE", f"{API}/orders/{{created}}", None),
+    ]
+
+
+def _is_orders(relation) -> bool:
+    # сама orders или её партиции (orders_legacy, orders_y2026m11, orders_default)
+    return relation is not None and (relation == "orders" or relation.startswith("orders_"))
+
+
+def _seq_scans(plan: dict) -> list:
+    found = []
+    if plan.get("Node Type") == "Seq Scan" and _is_orders(plan.get("Relation Name")):
+        found.append(f'{plan["Relation Name"]} {plan.get("Filter", "(no filter)")}')
+    for child in plan.get("Plans", ()):
+        found.extend(_seq_scans(child))
+    return found
+
+
+def _in_period(relation: str) -> bool:
+    # помесячная партиция, пересекающаяся с [FUTURE_MONTH, FUTURE_MONTH_END);
+    # orders_legacy и orders_default период не ограничивают и должны отсекаться
+    match = MONTHLY_PARTITION.match(relation)
+    if match is None:
+        return False
+    month = datetime.date(int(match.group(1)), int(match.group(2)), 1)
+    return FUTURE_MONTH <= month < FUTURE_MONTH_END
+
+
+def _relations(plan: dict) -> set:
+    found = {plan["Relation Name"]} if _is_orders(plan.get("Relation Name")) else set()
+    for child in plan.get("Plans", ()):
+        found |= _relations(child)
+    return found
+
+
+async def _collect() -> dict:
+    """
+    Выполнить сценарии и вернуть {сценарий: [(statement, план EXPLAIN), ...]}
+    """
+    captured = {}
+    current = {"name": None}
+
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        if current["name"] and not executemany and ORDERS_TABLE.search(statement):
+            captured.setdefault(current["name"], []).append((statement, tuple(parameters or ())))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://plans") as client:
+        async def _first(path):
+            r = await client.get(path, params={"limit": 1, "count": "none"})
+            r.raise_for_status()
+            items = r.json()["items"]
+            if not items:
+                pytest.fail("database is empty, run python -m benchmarks.seed first")
+            return items[0]
+
+        order = await _first(f"{API}/orders/")
+        ids = {"customer": order["customer_id"], "vegetable": order["vegetable_id"], "order": order["uuid"]}
+
+        event.listen(engine.sync_engine, "before_cursor_execute", _capture)
+        try:
+            for name, method, url, body in _scenarios(ids):
+                current["name"] = name
+                r = await client.request(method, url, json=body)
+                assert r.status_code < 400, (name, r.status_code, r.text)
+
+            created = None
+            for name, method, url, body in _write_scenarios(ids):
+                current["name"] = name
+                r = await client.request(method, url.format(created=created), json=body)
+                assert r.status_code < 400, (name, r.status_code, r.text)
+                created = created or r.json()["uuid"]
+        finally:
+            current["name"] = None
+            event.remove(engine.sync_engine, "before_cursor_execute", _capture)
+
+        for name, statement in FOREIGN_KEY_CHECKS.items():
+            captured[name] = [(statement, (UUID(ids[name.split(".")[1]]),))]
+
+    plans = {}
+    async with engine.connect() as connection:
+        raw = (await connection.get_raw_connection()).driver_connection
+        for name, statements in captured.items():
+            for statement, parameters in statements:
+                # EXPLAIN без ANALYZE ничего не выполняет, транзакция нужна только для SET LOCAL
+                transaction = raw.transaction()
+                await transaction.start()
+                try:
+                    await raw.execute("SET LOCAL enable_seqscan = off")
+                    plan = await raw.fetchval(f"EXPLAIN (FORMAT JSON) {statement}", *parameters)
+                finally:
+                    await transaction.rollback()
+                plans.setdefault(name, []).append((statement, json.loads(plan) if isinstance(plan, str) else plan))
+    await engine.dispose()
+    return plans
+
+
+@pytest.fixture(scope="module")
+def plans():
+    return asyncio.run(_collect())
+
+
+def test_no_sequential_scans_on_orders(plans):
+    assert plans, "no statements touching orders were captured"
+    offenders = []
+    for name, explained in plans.items():
+        if name in FULL_SCAN_ALLOWED:
+            continue
+        for statement, plan in explained:
+            for scan_filter in _seq_scans(plan[0]["Plan"]):
+                offenders.append(f"{name}: Seq Scan on {scan_filter}\n    {statement}")
+    assert not offenders, "\n".join(offenders)
+
+
+def test_period_filters_prune_partitions(plans):
+    offenders = []
+    for name, explained in plans.items():
+        if name not in PERIOD_SCENARIOS:
+            continue
+        for statement, plan in explained:
+            scanned = _relations(plan[0]["Plan"])
+            # сама orders встречается только как узел изменения, строки читаются из партиций
+            if any(relation != "orders" and not _in_period(relation) for relation in scanned):
+                offenders.append(f"{name}: {', '.join(sorted(scanned))}\n    {statement}")
+    assert not offenders, "\n".join(offenders)
+
+
+def test_analytics_does_not_read_orders(plans):
+    # аналитика читает материализованные представления, а не orders
+    assert not [name for name in plans if name.startswith("analytics.")]